@@ -0,0 +1,106 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   audioIO.py
+#       the sample format policy of the pipeline. wav files are decoded
+#       once into normalized floats (full scale is +-1.0) of the working
+#       dtype, float32 unless the AUDIO_DTYPE environment variable or
+#       setDtype picks another, and everything in between (noisify,
+#       LMS, the metrics) stays in that dtype. samples are only converted
+#       back to 16-bit when they are written, rounding and saturating at
+#       full scale instead of wrapping around
+#
+#       mono files decode to 1-d arrays and multi-channel files to
+#       (channels x samples) arrays. when a canonical rate is set (the
+#       AUDIO_RATE environment variable or setRate) every file is
+#       resampled to it as it is decoded
+#
+#   Preconditions: wav files are 16-bit PCM
+#
+#   Postconditions: none, this module only converts and reads/writes
+#       the files it is given
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+#import dependencies
+import os
+import numpy as np
+import scipy.io.wavfile as wf
+from math import gcd
+
+# the working dtype, read from the environment so pool workers share it
+dtype = np.dtype(os.environ.get("AUDIO_DTYPE", "float32"))
+
+# the canonical sample rate, None keeps each file at its own rate
+rate = int(os.environ["AUDIO_RATE"]) if os.environ.get("AUDIO_RATE") else None
+
+# the value of a 16-bit sample at full scale
+fullScale = 32768
+
+# selects the working dtype ("float32" or "float64") for this process and
+#   the workers it starts from now on
+def setDtype(name):
+    global dtype
+    dtype = np.dtype(name)
+    os.environ["AUDIO_DTYPE"] = dtype.name
+
+# selects the canonical sample rate for this process and the workers it
+#   starts from now on, None turns resampling off
+def setRate(sRate):
+    global rate
+    rate = None if sRate is None else int(sRate)
+    if rate is None:
+        os.environ.pop("AUDIO_RATE", None)
+    else:
+        os.environ["AUDIO_RATE"] = str(rate)
+
+# resamples normalized samples (along the last axis) from sRate to newRate
+#   with a polyphase filter. scipy.signal is slow to import, so it is only
+#   imported once something needs resampling
+def resample(data, sRate: int, newRate: int):
+    if sRate == newRate:
+        return data
+    from scipy.signal import resample_poly
+    common = gcd(int(sRate), int(newRate))
+    return resample_poly(data, newRate // common, sRate // common, axis=-1).astype(dtype)
+
+# 16-bit samples to normalized floats of the working dtype. floats are
+#   taken to be normalized already and only cast
+def toFloat(data):
+    data = np.asarray(data)
+    if data.dtype.kind in "iu":
+        return data.astype(dtype) / dtype.type(fullScale)
+    return data.astype(dtype, copy=False)
+
+# normalized floats to 16-bit samples, rounded and clipped to full scale.
+#   NaN or inf (e.g. from a diverged filter) has no 16-bit value, so it
+#   raises instead of being written as garbage
+def toInt16(data):
+    data = np.asarray(data)
+    if not np.isfinite(data).all():
+        raise ValueError("samples are not finite, the signal diverged")
+    return np.clip(np.rint(data * fullScale), -fullScale, fullScale - 1).astype(np.int16)
+
+# the samples as they will be after writing them and reading them back
+def quantize(data):
+    return toFloat(toInt16(data))
+
+# the float type engines should compute in for these arrays: the working
+#   dtype unless an input is already wider
+def workType(*arrays):
+    return np.result_type(dtype, *[a.dtype for a in arrays if a.dtype.kind == "f"])
+
+# reads a wav file as (sample rate, normalized samples), channels first,
+#   at the canonical rate if one is set. resampled samples are quantized
+#   like every file the pipeline writes, so an original compares to its
+#   noisy and filtered outputs on the same 16-bit grid (a sample that is
+#   0 in the outputs is 0 here too)
+def readWav(inFile: str):
+    sRate, data = wf.read(inFile)
+    data = np.ascontiguousarray(toFloat(data).T)
+    if rate is not None and sRate != rate:
+        return rate, quantize(resample(data, sRate, rate))
+    return sRate, data
+
+# writes normalized samples (1-d or channels first) to a 16-bit wav file
+def writeWav(outFile: str, sRate: int, data):
+    wf.write(outFile, sRate, toInt16(data).T)
@@ -0,0 +1,107 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   audioMetrics.py
+#       vectorized error metrics comparing a processed signal (noisy or
+#       filtered) against the original recording: average percent
+#       error, signal to noise ratio, segmental SNR and log-spectral
+#       distortion, all computed from one call without modifying the
+#       input arrays
+#
+#   Preconditions: both signals are 1-D sample arrays from sounds with
+#       the same sampling frequency
+#
+#   Postconditions: a dict of metrics is returned, inputs are unchanged
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import numpy as np
+import audioIO
+
+# per-frame SNR is clamped to this range (dB) before averaging, the usual
+#   convention so silent frames don't dominate the segmental SNR
+seg_snr_floor = -10.0
+seg_snr_ceiling = 35.0
+
+# returns copies of acc and exp in the working dtype (see audioIO) with
+#   NaNs zeroed and exp trimmed or zero padded to the length of acc.
+#   signals may be 1-d or (channels x samples), every metric then covers
+#   all channels together
+def prepare_signals(acc, exp):
+    acc = np.nan_to_num(audioIO.toFloat(acc), nan=0.0)
+    exp = np.nan_to_num(audioIO.toFloat(exp), nan=0.0)
+    length = acc.shape[-1]
+    if exp.shape[-1] < length:
+        exp = np.pad(exp, [(0, 0)] * (exp.ndim - 1) + [(0, length - exp.shape[-1])])
+    return acc, exp[..., :length]
+
+# splits a signal into non-overlapping frames, dropping the final partial
+#   frame of each channel, returned as a (frames x frame_length) array
+#   with the frames of every channel one after the other
+def frame_signal(signal, frame_length):
+    frames = signal.shape[-1] // frame_length
+    return signal[..., :frames * frame_length].reshape(-1, frame_length)
+
+# average percent error relative to the original, rounded to the nearest
+#   whole number. samples where the original is 0 count as 0 error
+def percent_error(acc, exp):
+    return percent_error_of(*prepare_signals(acc, exp))
+
+# signal to noise ratio in dB, treating exp - acc as the noise
+def snr(acc, exp):
+    return snr_of(*prepare_signals(acc, exp))
+
+# mean of the clamped per-frame SNRs in dB
+def segmental_snr(acc, exp, sampling_frequency, frame_time=0.02):
+    acc, exp = prepare_signals(acc, exp)
+    return seg_snr_from_frames(*frames_for(acc, exp, sampling_frequency, frame_time))
+
+# mean per-frame RMS difference between the log power spectra in dB
+def spectral_distortion(acc, exp, sampling_frequency, frame_time=0.02):
+    acc, exp = prepare_signals(acc, exp)
+    return spectral_distortion_from_frames(*frames_for(acc, exp, sampling_frequency, frame_time))
+
+def percent_error_of(acc, exp):
+    nonzero = acc != 0
+    err = np.abs(acc[nonzero] - exp[nonzero]) / np.abs(acc[nonzero]) * 100
+    return round(float(err.sum()) / acc.size)
+
+def snr_of(acc, exp):
+    noise_energy = np.sum((acc - exp) ** 2)
+    if noise_energy == 0:
+        return np.inf
+    return float(10 * np.log10(np.sum(acc ** 2) / noise_energy))
+
+def frames_for(acc, exp, sampling_frequency, frame_time):
+    frame_length = max(1, int(sampling_frequency * frame_time))
+    return frame_signal(acc, frame_length), frame_signal(exp, frame_length)
+
+def seg_snr_from_frames(acc_frames, exp_frames):
+    if acc_frames.shape[0] == 0:
+        return np.nan
+    signal_energy = np.sum(acc_frames ** 2, axis=1)
+    noise_energy = np.sum((acc_frames - exp_frames) ** 2, axis=1)
+    # tiny offset keeps silent or perfect frames finite before clamping
+    eps = np.finfo(acc_frames.dtype).tiny
+    seg = 10 * np.log10((signal_energy + eps) / (noise_energy + eps))
+    return float(np.mean(np.clip(seg, seg_snr_floor, seg_snr_ceiling)))
+
+def spectral_distortion_from_frames(acc_frames, exp_frames):
+    if acc_frames.shape[0] == 0:
+        return np.nan
+    window = np.hanning(acc_frames.shape[1]).astype(acc_frames.dtype)
+    eps = np.finfo(acc_frames.dtype).tiny
+    acc_db = 10 * np.log10(np.abs(np.fft.rfft(acc_frames * window, axis=1)) ** 2 + eps)
+    exp_db = 10 * np.log10(np.abs(np.fft.rfft(exp_frames * window, axis=1)) ** 2 + eps)
+    return float(np.mean(np.sqrt(np.mean((acc_db - exp_db) ** 2, axis=1))))
+
+# computes every metric in a single pass over the two signals
+def compare(acc, exp, sampling_frequency, frame_time=0.02):
+    acc, exp = prepare_signals(acc, exp)
+    acc_frames, exp_frames = frames_for(acc, exp, sampling_frequency, frame_time)
+    return {
+        "percent_error": percent_error_of(acc, exp),
+        "snr": snr_of(acc, exp),
+        "seg_snr": seg_snr_from_frames(acc_frames, exp_frames),
+        "spectral_distortion": spectral_distortion_from_frames(acc_frames, exp_frames),
+    }
@@ -0,0 +1,86 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   backgroundIO.py
+#       overlaps file reads and writes with computation. a BackgroundIO
+#       runs reads and writes on a few threads, and at most `pending`
+#       of them can be queued or running at once, so a fast producer
+#       blocks instead of piling up decoded audio in memory. prefetch
+#       walks a list of items reading the next ones ahead while the
+#       caller works on the current one. wav decoding and writing spend
+#       their time in file I/O and numpy, which release the GIL, so the
+#       threads run alongside the filter and the metrics
+#
+#   Preconditions: none
+#
+#   Postconditions: every submitted operation has finished when the
+#       BackgroundIO is closed. errors are left in the futures for the
+#       caller to check
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import stageTrace
+
+class BackgroundIO:
+    # threads run the operations, pending bounds how many can be queued
+    #   or running before submit blocks
+    def __init__(self, threads=2, pending=4):
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.slots = threading.BoundedSemaphore(pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # runs fn(*args) on a background thread, returns its future. blocks
+    #   while `pending` operations are already queued or running. the
+    #   bytes it reads and writes count for the caller's open stage spans
+    def submit(self, fn, *args):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(stageTrace.carry(fn), *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        return future
+
+    # waits for every operation, then stops the threads
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+# yields (item, future of load(item)) for each item, keeping the loads of
+#   the next `ahead` items running on io meanwhile. items with the same
+#   key(item) share one load, e.g. jobs that read the same recording
+def prefetch(items: list, load, io: BackgroundIO, ahead=2, key=None):
+    key = key or (lambda item: id(item))
+    loads = {}
+    queue = deque()
+    items = iter(items)
+    def fill():
+        while len(queue) <= ahead:
+            item = next(items, None)
+            if item is None:
+                return
+            k = key(item)
+            if k not in loads:
+                loads[k] = io.submit(load, item)
+            queue.append((item, k))
+    fill()
+    while queue:
+        item, k = queue.popleft()
+        future = loads[k]
+        # drop the load once no queued item needs it, so decoded data
+        #   isn't kept past its last use
+        if all(k != other for _, other in queue):
+            del loads[k]
+        yield item, future
+        # refilled only once the caller is done with the item, so while
+        #   it works on one just the next `ahead` are loading
+        fill()
@@ -0,0 +1,364 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   benchmark.py
+#       times the hot paths of the audio pipeline on synthetic wav files:
+#       noisify, noisify at many levels in one pass, LMS with each
+#       engine, calc_avg_error, analyze_waveforms, draw_spectrograms
+#       and a full processAudio.main + processData.main
+#       run, plus how soon each of processAudio's autoCandidates converges
+#       on the synthetic recording, and how quickly pipeline.py starts.
+#       every stage runs in a fresh process so its peak memory can
+#       be measured, and the results are written as json and compared
+#       against a stored baseline to spot regressions
+#
+#   Preconditions: none, the synthetic Data tree is built in a
+#       temporary directory
+#
+#   Postconditions: a json report with the time, throughput (samples
+#       per second and real-time factor) and peak memory of each stage
+#       has been written, along with any regressions against the baseline
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+#import dependencies
+import argparse
+import json
+import os
+import os.path as path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import scipy.io.wavfile as wf
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# amplitudes used for the synthetic tree
+amplitudes = [0.05, 0.25, 0.5]
+
+# libraries only some stages need, which the startup stage reports when a
+#   subcommand's module loads them on import
+heavyModules = ["matplotlib", "parselmouth", "pocketsphinx", "scipy.signal", "nltk", "speech_recognition"]
+
+# peak resident memory of this process and of its finished children in
+#   MB, None where the resource module isn't available (windows)
+def peakRss():
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # linux reports kilobytes, macos bytes
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+# a speech-like test signal: a few harmonics with a slow syllable-rate
+#   envelope and a little background noise, as 16-bit samples
+def syntheticSpeech(seconds, sRate, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sRate)) / sRate
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sRate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+    signal = voice * envelope + 0.01 * rng.normal(0, 1, len(t))
+    return np.int16(signal / np.max(np.abs(signal)) * 0.8 * 32767)
+
+# builds a Data tree with one sentence holding `recordings` synthetic wavs
+def buildTree(root, seconds, sRate, recordings=1):
+    sentence = path.join(root, "Data", "SYN")
+    for folder in [path.join("_0riginal", "audio"), "analysis", "figures"]:
+        os.makedirs(path.join(sentence, folder), exist_ok=True)
+    for amp in amplitudes:
+        for folder in ["noisy", "filtered", "noise_references"]:
+            os.makedirs(path.join(sentence, f"_{int(amp * 100)}_percent", folder), exist_ok=True)
+    for i in range(recordings):
+        wf.write(path.join(sentence, "_0riginal", "audio", f"Synthetic{i}_bench.wav"), sRate, syntheticSpeech(seconds, sRate, i))
+    return sentence
+
+# the stages. each takes the benchmark config and the tree's sentence
+#   folder and returns the number of audio samples it processed
+def stageNoisify(config, sentence):
+    import processAudio
+    orig = path.join(sentence, "_0riginal", "audio", "Synthetic0_bench.wav")
+    for amp in amplitudes:
+        out = path.join(sentence, f"_{int(amp * 100)}_percent", "noisy", "Synthetic0_bench.wav")
+        processAudio.noisify(orig, out, amp, processAudio.noiseSeed(0, "SYN", "Synthetic0_bench.wav", amp))
+    return config["samples"] * len(amplitudes)
+
+# noisifies the recording at config["levels"] amplitudes in one pass, the
+#   way processAudio.runJobs noisifies every amplitude of a recording,
+#   with a noise per amplitude or one noise shared by every amplitude
+def stageNoisifyLevels(config, sentence, shared):
+    import processAudio
+    orig = path.join(sentence, "_0riginal", "audio", "Synthetic0_bench.wav")
+    amps = [float(amp) for amp in np.linspace(0.02, 0.5, config["levels"])]
+    outFiles = [path.join(sentence, "_levels", f"Synthetic0_bench_{i}_noisy.wav") for i in range(len(amps))]
+    seeds = [processAudio.noiseSeed(0, "SYN", "Synthetic0_bench.wav", 0 if shared else amp) for amp in amps]
+    processAudio.noisifyLevels(orig, outFiles, amps, seeds)
+    return config["samples"] * len(amps)
+
+# residual noise power over added noise power above which an lms stage
+#   counts the engine as diverged (a stable engine at a too large step
+#   can leave a little more noise than it was given, but not this much)
+divergedRatio = 2.0
+
+# filters the 25% recording. a diverged engine fails the stage: LMS
+#   refuses to write non-finite samples, and a residual noise past
+#   divergedRatio times the added noise is reported as diverged too
+def stageLMS(config, sentence, engine):
+    import audioIO
+    import processAudio
+    folder = path.join(sentence, "_25_percent")
+    noisy = path.join(folder, "noisy", "Synthetic0_bench_25_noisy.wav")
+    seed = processAudio.noiseSeed(0, "SYN", "Synthetic0_bench.wav", 0.25)
+    start = time.perf_counter()
+    ok = processAudio.LMS(noisy, path.join(folder, "filtered", "Synthetic0_bench.wav"),
+                          path.join(folder, "noise_references", "Synthetic0_bench.wav"),
+                          0.25, config["lRate"], config["fOrder"], engine, seed)
+    seconds = time.perf_counter() - start
+    if not ok:
+        raise RuntimeError(f"the {engine} engine failed")
+    original = audioIO.readWav(path.join(sentence, "_0riginal", "audio", "Synthetic0_bench.wav"))[1]
+    filtered = audioIO.readWav(path.join(folder, "filtered", "Synthetic0_bench_25_filtered.wav"))[1]
+    if not np.isfinite(filtered).all():
+        raise RuntimeError(f"the {engine} engine wrote non-finite samples")
+    # residual noise power over added noise power, past the first second
+    skip = config["sRate"]
+    ratio = float(np.mean((filtered - original)[skip:-100] ** 2) / np.mean((audioIO.readWav(noisy)[1] - original)[skip:-100] ** 2))
+    if not ratio < divergedRatio:
+        raise RuntimeError(f"the {engine} engine diverged, residual noise is {ratio:.3g}x the added noise")
+    return config["samples"], seconds, {"residual_noise_ratio": ratio}
+
+# returns (samples, seconds, extra measurements) for one engine probed
+#   the way processAudio.main(engine="auto") does
+def stageConvergence(config, sentence, engine):
+    import processAudio
+    job = [j for j in processAudio.buildJobs(path.dirname(sentence), [0.25]) if j["recording"] == "Synthetic0_bench.wav"][0]
+    rate = processAudio.autoCandidates[engine]
+    result = processAudio.probeEngines(job, [(engine, config["lRate"] if rate is None else rate, {})],
+                                       config["fOrder"], config["target"], config["seconds"])[0]
+    return config["samples"], result["seconds"], {"convergence_samples": result["convergenceSample"],
+                                                  "convergence_seconds": result["convergenceSeconds"]}
+
+def stageCalcAvgError(config, sentence):
+    import parselmouth as pm
+    import processData
+    original = pm.Sound(path.join(sentence, "_0riginal", "audio", "Synthetic0_bench.wav"))
+    filtered = pm.Sound(path.join(sentence, "_25_percent", "filtered", "Synthetic0_bench_25_filtered.wav"))
+    start = time.perf_counter()
+    processData.calc_avg_error(original, filtered)
+    return config["samples"], time.perf_counter() - start
+
+# the lms stages only filter the 25% recording, so the figures are drawn
+#   for that amplitude
+def stageAnalyzeWaveforms(config, sentence):
+    import processData
+    orig = path.join(sentence, "_0riginal", "audio", "Synthetic0_bench.wav")
+    processData.analyze_waveforms("Synthetic0_bench.wav", orig, [0.25])
+    return config["samples"]
+
+def stageDrawSpectrograms(config, sentence):
+    import processData
+    orig = path.join(sentence, "_0riginal", "audio", "Synthetic0_bench.wav")
+    processData.draw_spectrograms("Synthetic0_bench.wav", orig, [0.25])
+    return config["samples"]
+
+def stageEndToEnd(config, sentence):
+    import processAudio
+    import processData
+    root = path.dirname(path.dirname(sentence))
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        if not processAudio.main(config["engine"], config["lRate"], config["fOrder"], workers=config["workers"], force=True):
+            raise RuntimeError("processAudio.main failed")
+        if not processData.main(force=True, workers=config["workers"]):
+            raise RuntimeError("processData.main failed")
+    finally:
+        os.chdir(cwd)
+    return config["samples"] * len(amplitudes) * config["recordings"]
+
+# seconds a fresh interpreter takes to import module from the repo, and
+#   which heavyModules the import loaded
+def importCost(repo, module):
+    code = (f"import sys, time; sys.path.insert(0, {repo!r}); start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start); print(' '.join(m for m in {heavyModules!r} if m in sys.modules))")
+    lines = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split("\n")
+    return float(lines[0]), lines[1].split()
+
+# how long `pipeline.py --help` takes in a fresh interpreter (best of
+#   three) against the startup target, and the import cost of the module
+#   behind each subcommand, which every worker process pays too
+def stageStartup(config, sentence):
+    import pipeline
+    runs = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, path.join(config["repo"], "pipeline.py"), "--help"], capture_output=True, check=True)
+        runs.append(time.perf_counter() - start)
+    seconds = min(runs)
+    extra = {"target_seconds": config["startupTarget"], "meets_target": seconds <= config["startupTarget"]}
+    for module in sorted(set(pipeline.commandModules.values())):
+        extra[f"import_{module}_seconds"], extra[f"import_{module}_loads"] = importCost(config["repo"], module)
+    return 0, seconds, extra
+
+# stages that use parselmouth or matplotlib
+libraryStages = {"calc_avg_error", "analyze_waveforms", "draw_spectrograms", "end_to_end"}
+
+# runs in a fresh process: times one stage, returns its measurements
+def runStage(name, config, sentence):
+    sys.path.insert(0, config["repo"])
+    stage = stages()[name]
+    # load up front so module loading isn't timed as part of the stage.
+    #   parselmouth and matplotlib are only imported on first use, so the
+    #   stages that analyze or draw load them here
+    import processData
+    if name in libraryStages:
+        import parselmouth
+        import renderFigures
+        renderFigures.new_figure()
+    start = time.perf_counter()
+    cpuStart = time.process_time()
+    result = stage(config, sentence)
+    seconds = time.perf_counter() - start
+    # stages may time just their own work, excluding setup, and add their
+    #   own measurements
+    extra = {}
+    if isinstance(result, tuple):
+        result, seconds, *extra = result
+        extra = extra[0] if extra else {}
+    selfRss, childRss = peakRss()
+    return {**extra,
+            "seconds": seconds,
+            "cpu_seconds": time.process_time() - cpuStart,
+            "samples": result,
+            "samples_per_second": result / seconds if seconds else None,
+            "real_time_factor": result / config["sRate"] / seconds if seconds else None,
+            "peak_rss_mb": selfRss,
+            "peak_child_rss_mb": childRss}
+
+# every stage by name, one LMS stage per engine
+def stages():
+    import processAudio
+    named = {"startup": stageStartup, "noisify": stageNoisify,
+             "noisify_levels": lambda config, sentence: stageNoisifyLevels(config, sentence, False),
+             "noisify_levels_shared": lambda config, sentence: stageNoisifyLevels(config, sentence, True)}
+    for engine in processAudio.engines:
+        named[f"lms_{engine}"] = lambda config, sentence, engine=engine: stageLMS(config, sentence, engine)
+    for engine in processAudio.autoCandidates:
+        named[f"converge_{engine}"] = lambda config, sentence, engine=engine: stageConvergence(config, sentence, engine)
+    named.update({"calc_avg_error": stageCalcAvgError,
+                  "analyze_waveforms": stageAnalyzeWaveforms,
+                  "draw_spectrograms": stageDrawSpectrograms,
+                  "end_to_end": stageEndToEnd})
+    return named
+
+# runs the selected stages in order (later stages read earlier outputs)
+#   each in its own spawned process. the pool's worker isn't a daemon so
+#   the end to end stage can start its own pools. a failing stage is
+#   reported and the rest still run
+def runBenchmark(config, only=None):
+    root = tempfile.mkdtemp(prefix="audio_bench_")
+    report = {"config": config,
+              "python": platform.python_version(),
+              "machine": platform.machine(),
+              "stages": {}}
+    try:
+        sentence = buildTree(root, config["seconds"], config["sRate"], config["recordings"])
+        context = multiprocessing.get_context("spawn")
+        for name in stages():
+            if only and name not in only:
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                try:
+                    report["stages"][name] = pool.submit(runStage, name, config, sentence).result()
+                except Exception as e:
+                    report["stages"][name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{name}: {report['stages'][name]}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return report
+
+# lists the stages that got slower than the baseline by more than
+#   tolerance, and the lms stages that left more residual noise
+def compareBaseline(report, baseline, tolerance=0.2):
+    regressions = []
+    for name, result in report["stages"].items():
+        before = baseline["stages"].get(name, {})
+        if "residual_noise_ratio" in result and "residual_noise_ratio" in before \
+                and result["residual_noise_ratio"] > before["residual_noise_ratio"] * (1 + tolerance):
+            regressions.append({"stage": name,
+                                "residual_noise_ratio": result["residual_noise_ratio"],
+                                "baseline_residual_noise_ratio": before["residual_noise_ratio"]})
+        if "seconds" in result and "seconds" in before and result["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append({"stage": name,
+                                "seconds": result["seconds"],
+                                "baseline_seconds": before["seconds"],
+                                "slowdown": result["seconds"] / before["seconds"]})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the audio pipeline on synthetic recordings")
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of each synthetic recording")
+    parser.add_argument("--rate", type=int, default=44100, help="sample rate of the synthetic recordings")
+    parser.add_argument("--order", type=int, default=100, help="LMS filter order")
+    parser.add_argument("--lrate", type=float, default=0.01, help="LMS learning rate (the pipeline default)")
+    parser.add_argument("--target", type=float, default=0.1, help="residual to added noise power ratio counted as converged")
+    parser.add_argument("--engine", default="block", help="LMS engine for the end to end stage")
+    parser.add_argument("--levels", type=int, default=24, help="noise levels in the noisify_levels stage")
+    parser.add_argument("--recordings", type=int, default=2, help="recordings in the end to end stage")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for the end to end stage")
+    parser.add_argument("--stages", nargs="*", help="only run these stages")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the report")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="baseline report to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--startup-target", type=float, default=0.25, help="seconds pipeline.py --help may take to start")
+    args = parser.parse_args(argv)
+
+    config = {"seconds": args.seconds,
+              "sRate": args.rate,
+              "samples": int(args.seconds * args.rate),
+              "fOrder": args.order,
+              "lRate": args.lrate,
+              "target": args.target,
+              "engine": args.engine,
+              "levels": args.levels,
+              "recordings": args.recordings,
+              "workers": args.workers,
+              "startupTarget": args.startup_target,
+              "repo": path.dirname(path.abspath(__file__))}
+    report = runBenchmark(config, args.stages)
+    if path.isfile(args.baseline):
+        with open(args.baseline, "r") as f:
+            report["regressions"] = compareBaseline(report, json.load(f), args.tolerance)
+        for r in report["regressions"]:
+            if "seconds" in r:
+                print(f"REGRESSION: {r['stage']} took {r['seconds']:.3f}s, baseline {r['baseline_seconds']:.3f}s")
+            else:
+                print(f"REGRESSION: {r['stage']} left {r['residual_noise_ratio']:.3g}x the added noise, "
+                      f"baseline {r['baseline_residual_noise_ratio']:.3g}x")
+    # a stage that failed (e.g. a diverged engine) is a regression too
+    for name, result in report["stages"].items():
+        if "error" in result:
+            report.setdefault("regressions", []).append({"stage": name, "error": result["error"]})
+            print(f"REGRESSION: {name} failed ({result['error']})")
+    startup = report["stages"].get("startup", {})
+    if startup.get("meets_target") is False:
+        report.setdefault("regressions", []).append({"stage": "startup", "seconds": startup["seconds"],
+                                                     "target_seconds": startup["target_seconds"]})
+        print(f"REGRESSION: startup took {startup['seconds']:.3f}s, target {startup['target_seconds']:.3f}s")
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+    return not report.get("regressions")
+
+if __name__ == "__main__":
+    # regressions and failed stages exit non-zero, e.g. to fail a ci job
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,108 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   buildManifest.py
+#       records what each processing job last consumed and produced so
+#       reruns of processAudio and processData can skip jobs whose
+#       inputs and parameters haven't changed
+#
+#   Preconditions: none, a missing manifest file is treated as empty
+#
+#   Postconditions: the manifest is a json file holding, for every job,
+#       the content hashes of its inputs, its parameters, its output
+#       paths and (optionally) any results needed to rebuild summaries
+#       without rerunning the job
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import hashlib
+import json
+import os
+import os.path as path
+
+# reads a manifest, returning an empty one if it doesn't exist yet
+def load_manifest(manifest_path: str):
+    if path.isfile(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        manifest.setdefault("files", {})
+        manifest.setdefault("jobs", {})
+        return manifest
+    return {"files": {}, "jobs": {}}
+
+# writes the manifest through a temporary file so an interrupted run
+#   never leaves a half-written manifest behind
+def save_manifest(manifest: dict, manifest_path: str):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+# sha256 of a file's contents. the hash is remembered with the file's
+#   size and mtime, so unchanged files are not read again on later runs
+def file_hash(manifest: dict, file_path: str):
+    stat = os.stat(file_path)
+    key = path.abspath(file_path)
+    known = manifest["files"].get(key)
+    if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+        return known["sha256"]
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    manifest["files"][key] = {"size": stat.st_size,
+                              "mtime": stat.st_mtime_ns,
+                              "sha256": digest.hexdigest()}
+    return digest.hexdigest()
+
+# hashes every input, returns None if any input is missing
+def input_hashes(manifest: dict, inputs: list):
+    hashes = {}
+    for file_path in inputs:
+        if not path.isfile(file_path):
+            return None
+        hashes[file_path] = file_hash(manifest, file_path)
+    return hashes
+
+# true if the job already ran with identical inputs and parameters and
+#   all of its outputs are still on disk
+def job_is_current(manifest: dict, key: str, inputs: list, params: dict, outputs: list):
+    entry = manifest["jobs"].get(key)
+    if entry is None:
+        return False
+    hashes = input_hashes(manifest, inputs)
+    if hashes is None or hashes != entry["inputs"]:
+        return False
+    # round trip the parameters through json so tuples/lists compare equal
+    if json.loads(json.dumps(params)) != entry["params"]:
+        return False
+    return sorted(outputs) == entry["outputs"] and all(path.isfile(o) for o in outputs)
+
+# records a successful job run
+def record_job(manifest: dict, key: str, inputs: list, params: dict, outputs: list, results=None):
+    manifest["jobs"][key] = {"inputs": input_hashes(manifest, inputs),
+                             "params": json.loads(json.dumps(params)),
+                             "outputs": sorted(outputs),
+                             "results": results}
+
+# returns the results stored with a job, or None
+def job_results(manifest: dict, key: str):
+    entry = manifest["jobs"].get(key)
+    return entry["results"] if entry else None
+
+# adds the files and jobs of another manifest (e.g. one node's shard) to
+#   manifest, the other manifest's entries win
+def merge_manifest(manifest: dict, other: dict):
+    manifest["files"].update(other["files"])
+    manifest["jobs"].update(other["jobs"])
+    return manifest
+
+# returns the engine and filter parameters processAudio used for one
+#   recording at one amplitude, as recorded in its manifest
+def filter_settings(audio_manifest, sentence: str, fileName: str, amp: float):
+    entry = audio_manifest["jobs"].get(f"{sentence}/{fileName}@{amp}") if audio_manifest else None
+    if entry is None:
+        return "unknown", {}
+    params = dict(entry["params"])
+    params.pop("amp", None)
+    return params.pop("engine", "unknown"), params
@@ -0,0 +1,132 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   dataLayout.py
+#       where every file of the pipeline lives in the Data tree, built
+#       with pathlib so the same code runs on windows and linux. the
+#       DataLayout class maps (sentence, recording, amplitude) to the
+#       original, noisy, filtered and reference wav files and to the
+#       analysis and figure outputs; a different tree structure can be
+#       used by subclassing it. jobs can be split across several nodes
+#       by a stable hash of the recording, so every node processes a
+#       disjoint shard and the shards' results can be merged afterwards
+#
+#   Preconditions: the Data tree holds one folder per sentence, each
+#       with a _0riginal/audio folder of wav recordings (see
+#       processAudio.py). every other folder is created on demand
+#
+#   Postconditions: none, this module only computes paths and creates
+#       the folders asked for
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import zlib
+from pathlib import Path
+
+# the folder name of an amplitude, e.g. 0.05 -> "_5_percent"
+def percent(amp: float):
+    return int(amp * 100)
+
+class DataLayout:
+    # root is the Data folder
+    def __init__(self, root="Data"):
+        self.root = Path(root)
+
+    # sentence folders holding original recordings, sorted by name
+    def sentences(self):
+        if not self.root.is_dir():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if self.original_dir(p.name).is_dir())
+
+    def sentence_dir(self, sentence: str):
+        return self.root / sentence
+
+    def original_dir(self, sentence: str):
+        return self.sentence_dir(sentence) / "_0riginal" / "audio"
+
+    # the wav recordings of a sentence, sorted by name
+    def recordings(self, sentence: str):
+        origin = self.original_dir(sentence)
+        if not origin.is_dir():
+            return []
+        return sorted(p.name for p in origin.iterdir() if p.suffix == ".wav")
+
+    def original(self, sentence: str, recording: str):
+        return self.original_dir(sentence) / recording
+
+    def amp_dir(self, sentence: str, amp: float):
+        return self.sentence_dir(sentence) / f"_{percent(amp)}_percent"
+
+    # the output of one kind ("noisy", "filtered" or "noise_references")
+    #   and its name before processAudio adds the amplitude suffix
+    def output_base(self, sentence: str, recording: str, amp: float, kind: str):
+        return self.amp_dir(sentence, amp) / kind / recording
+
+    def noisy(self, sentence: str, recording: str, amp: float):
+        return self.output_base(sentence, recording, amp, "noisy").with_name(
+            recording.replace(".wav", f"_{percent(amp)}_noisy.wav"))
+
+    # the noise settings a noisy recording was made with, next to it
+    def noise_settings(self, sentence: str, recording: str, amp: float):
+        return self.noisy(sentence, recording, amp).with_suffix(".json")
+
+    def filtered(self, sentence: str, recording: str, amp: float):
+        return self.output_base(sentence, recording, amp, "filtered").with_name(
+            recording.replace(".wav", f"_{percent(amp)}_filtered.wav"))
+
+    def reference(self, sentence: str, recording: str, amp: float):
+        return self.output_base(sentence, recording, amp, "noise_references").with_name(
+            recording.replace(".wav", f"_{percent(amp)}_noise_ref.wav"))
+
+    # the sentence's english transcription and its Arpabet phonemes
+    def transcript(self, sentence: str):
+        return self.sentence_dir(sentence) / "transcript.txt"
+
+    def transcript_phonemes(self, sentence: str):
+        return self.sentence_dir(sentence) / "transcript.ipa"
+
+    def analysis_dir(self, sentence: str):
+        return self.sentence_dir(sentence) / "analysis"
+
+    def analysis(self, sentence: str, recording: str):
+        return self.analysis_dir(sentence) / recording.replace(".wav", "_analysis.txt")
+
+    def averages(self, sentence: str):
+        return self.analysis_dir(sentence) / "averages.txt"
+
+    def figures_dir(self, sentence: str):
+        return self.sentence_dir(sentence) / "figures"
+
+    def waveforms(self, sentence: str, recording: str, amp: float):
+        return self.figures_dir(sentence) / recording.replace(".wav", f"_{percent(amp)}_waveforms.png")
+
+    def spectrograms(self, sentence: str, recording: str, amp: float):
+        return self.figures_dir(sentence) / recording.replace(".wav", f"_{percent(amp)}_spectrograms.png")
+
+    # every (sentence, recording, amp) job in the tree, optionally only
+    #   those of one shard (see in_shard)
+    def jobs(self, amplitudes: list, node=0, nodes=1):
+        return [(sentence, recording, amp)
+                for sentence in self.sentences()
+                for recording in self.recordings(sentence)
+                if in_shard(sentence, recording, node, nodes)
+                for amp in amplitudes]
+
+# creates the folders the given files go in
+def make_parents(*files):
+    for f in files:
+        Path(f).parent.mkdir(parents=True, exist_ok=True)
+
+# the node (0 to nodes - 1) a recording belongs to. the hash only depends
+#   on the sentence and recording names, so every node computes the same
+#   split and all amplitudes of a recording land on the same node
+def shard_of(sentence: str, recording: str, nodes: int):
+    return zlib.crc32(f"{sentence}/{recording}".encode()) % nodes
+
+def in_shard(sentence: str, recording: str, node=0, nodes=1):
+    return nodes <= 1 or shard_of(sentence, recording, nodes) == node
+
+# the suffix added to per-node files (manifests, result stores), empty
+#   when the corpus isn't sharded
+def shard_suffix(node=0, nodes=1):
+    return "" if nodes <= 1 else f".shard{node}of{nodes}"
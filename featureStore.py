@@ -0,0 +1,122 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   featureStore.py
+#       a persistent on-disk cache for spectrogram and MFCC matrices.
+#       entries are keyed by the content hash of the audio file plus the
+#       analysis parameters, saved as .npy files that are memory mapped
+#       on load, and the least recently used entries are removed once
+#       the store grows past max_bytes
+#
+#   Preconditions: none, the store directory is created on first use
+#
+#   Postconditions: each requested feature matrix has been computed at
+#       most once per (audio content, parameters) and saved to the store
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import hashlib
+import json
+import os
+import os.path as path
+import numpy as np
+import audioIO
+import buildManifest
+import stageTrace
+
+# where features are stored and how large the store may grow
+store_dir = path.join("Data", ".features")
+max_bytes = 2 * 1024 ** 3
+
+# remembers file hashes (by size and mtime) for the life of the process
+hash_cache = {"files": {}}
+
+# returns the store key for a file's features of the given kind. the
+#   canonical rate is part of the key since the sound is resampled to it
+def feature_key(file_path: str, kind: str, params: dict):
+    audio_hash = buildManifest.file_hash(hash_cache, file_path)
+    description = json.dumps({"audio": audio_hash, "kind": kind, "params": params, "rate": audioIO.rate}, sort_keys=True)
+    return kind + "_" + hashlib.sha256(description.encode()).hexdigest()[:32]
+
+# returns (values, meta) from the store for key, or None on a miss. values
+#   is memory mapped read-only so only the parts used are ever read
+def load_entry(key: str):
+    values_path = path.join(store_dir, key + ".npy")
+    meta_path = path.join(store_dir, key + ".json")
+    if not (path.isfile(values_path) and path.isfile(meta_path)):
+        return None
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    values = np.load(values_path, mmap_mode="r")
+    stageTrace.read_file(values_path)
+    # mark the entry as recently used for eviction
+    os.utime(values_path)
+    return values, meta
+
+# saves an entry, writing through temporary files so that workers
+#   storing the same features at once can't corrupt each other's output
+def save_entry(key: str, values, meta: dict):
+    os.makedirs(store_dir, exist_ok=True)
+    values_path = path.join(store_dir, key + ".npy")
+    meta_path = path.join(store_dir, key + ".json")
+    tmp_suffix = f".{os.getpid()}.tmp"
+    with open(values_path + tmp_suffix, "wb") as f:
+        np.save(f, np.ascontiguousarray(values))
+    with open(meta_path + tmp_suffix, "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + tmp_suffix, meta_path)
+    os.replace(values_path + tmp_suffix, values_path)
+    stageTrace.wrote_file(values_path)
+    evict()
+
+# removes least recently used entries until the store fits in max_bytes
+def evict():
+    entries = []
+    total = 0
+    for name in os.listdir(store_dir):
+        if name.endswith(".npy"):
+            values_path = path.join(store_dir, name)
+            stat = os.stat(values_path)
+            entries.append((stat.st_mtime, values_path))
+            total += stat.st_size
+    for _, values_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        total -= os.stat(values_path).st_size
+        os.remove(values_path)
+        meta_path = values_path[:-len(".npy")] + ".json"
+        if path.isfile(meta_path):
+            os.remove(meta_path)
+
+# returns the stored features for file_path, computing and storing them
+#   first if needed. compute() must return (values, meta)
+def load_or_compute(file_path: str, kind: str, params: dict, compute):
+    key = feature_key(file_path, kind, params)
+    entry = load_entry(key)
+    if entry is None:
+        with stageTrace.stage(kind, file=file_path):
+            values, meta = compute()
+            save_entry(key, values, meta)
+        return np.asarray(values), meta
+    return entry
+
+# spectrogram power values of a wav file plus its time/frequency grid
+#   (xmin, xmax, ymin, ymax, ...). load(file_path) decodes the sound, it
+#   is only called on a miss. params are passed to Sound.to_spectrogram
+def spectrogram(file_path: str, load, **params):
+    def compute():
+        sg = load(file_path).to_spectrogram(**params)
+        meta = {"xmin": sg.xmin, "xmax": sg.xmax, "nx": sg.nx, "dx": sg.dx, "x1": sg.x1,
+                "ymin": sg.ymin, "ymax": sg.ymax, "ny": sg.ny, "dy": sg.dy, "y1": sg.y1}
+        return sg.values, meta
+    return load_or_compute(file_path, "spectrogram", params, compute)
+
+# MFCC frames of a wav file as a (frames x coefficients) matrix, load and
+#   params work as in spectrogram, params are passed to Sound.to_mfcc
+def mfcc(file_path: str, load, **params):
+    def compute():
+        mfcc_obj = load(file_path).to_mfcc(**params)
+        meta = {"xmin": mfcc_obj.xmin, "xmax": mfcc_obj.xmax, "nx": mfcc_obj.nx,
+                "dx": mfcc_obj.dx, "x1": mfcc_obj.x1}
+        return mfcc_obj.to_array().T, meta
+    return load_or_compute(file_path, "mfcc", params, compute)
@@ -0,0 +1,100 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   liveFilter.py
+#       a stateful version of the LMS filter in processAudio.LMS for
+#       filtering live audio, e.g. buffers coming from a capture loop.
+#       the filter keeps its coefficients and the reference history
+#       between calls, so audio can be pushed through in blocks of any
+#       size and each block is returned as soon as it is processed
+#
+#   Preconditions: the noisy input and the reference noise arrive in
+#       blocks of equal length
+#
+#   Postconditions: each call returns the filtered block, the latency
+#       added by the filter is the length of the block pushed in
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+#import dependencies
+import numpy as np
+import time
+import audioIO
+
+class LiveLMS:
+    # lRate and fOrder are the same as in processAudio.LMS. the filter
+    #   adapts once every blockSize samples with the mean gradient of the
+    #   block (1 gives plain sample-by-sample LMS). a pushed block that
+    #   isn't a multiple of blockSize ends with one shorter update so the
+    #   whole block can be returned right away
+    def __init__(self, lRate=0.01, fOrder=100, blockSize=32):
+        self.lRate = lRate
+        self.fOrder = fOrder
+        self.blockSize = blockSize
+        self.reset()
+
+    # forgets everything learned so far
+    def reset(self):
+        self.filtCoef = np.zeros(self.fOrder, dtype=audioIO.dtype)
+        self.history = np.zeros(self.fOrder, dtype=audioIO.dtype)
+
+    # filters block_in using the matching block of reference noise and
+    #   returns the filtered block
+    def process(self, block_in, block_ref):
+        block_in = np.asarray(block_in, dtype=audioIO.dtype)
+        block_ref = np.asarray(block_ref, dtype=audioIO.dtype)
+        if block_in.shape != block_ref.shape:
+            raise ValueError("block_in and block_ref must be the same length")
+        # row i is the fOrder reference samples before sample i of the block
+        reference = np.concatenate((self.history, block_ref))
+        windows = np.lib.stride_tricks.sliding_window_view(reference, self.fOrder)
+        block_out = np.empty(len(block_in), dtype=audioIO.dtype)
+
+        for start in range(0, len(block_in), self.blockSize):
+            stop = min(start + self.blockSize, len(block_in))
+            noiseInput = windows[start:stop]
+            error = block_in[start:stop] - noiseInput @ self.filtCoef
+            self.filtCoef += self.lRate / self.blockSize * (error @ noiseInput)
+            block_out[start:stop] = error
+
+        self.history = reference[len(reference) - self.fOrder:]
+        return block_out
+
+# measures the real-time factor (seconds of audio filtered per second of
+#   compute) of LiveLMS for each sample rate and filter order, pushing
+#   seconds of audio through in buffers of bufferTime seconds
+def benchmark(sRates=(16000, 44100, 48000), fOrders=(32, 100, 256, 1024), seconds=5.0, bufferTime=0.01, blockSize=32):
+    results = []
+    rng = np.random.default_rng(0)
+    for sRate in sRates:
+        bufferSize = max(1, int(sRate * bufferTime))
+        audio = rng.normal(0, 1000, int(sRate * seconds))
+        reference = rng.normal(0, 1, len(audio))
+        for fOrder in fOrders:
+            live = LiveLMS(1e-6, fOrder, blockSize)
+            worst = 0.0
+            begin = time.perf_counter()
+            for start in range(0, len(audio), bufferSize):
+                tick = time.perf_counter()
+                live.process(audio[start:start + bufferSize], reference[start:start + bufferSize])
+                worst = max(worst, time.perf_counter() - tick)
+            elapsed = time.perf_counter() - begin
+            results.append({"sRate": sRate,
+                            "fOrder": fOrder,
+                            "bufferSize": bufferSize,
+                            "realTimeFactor": seconds / elapsed,
+                            "worstBufferMs": worst * 1000,
+                            "bufferMs": bufferSize / sRate * 1000})
+    return results
+
+def main():
+    print("rate\t\t|\torder\t\t|\tbuffer\t\t|\treal-time factor\t\t|\tworst buffer")
+    for r in benchmark():
+        print(f"{r['sRate']} Hz\t\t|\t"
+              f"{r['fOrder']}\t\t|\t"
+              f"{r['bufferMs']:.1f} ms\t\t|\t"
+              f"{r['realTimeFactor']:.1f}x\t\t|\t"
+              f"{r['worstBufferMs']:.2f} ms")
+    return True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   paramSweep.py
+#       runs the LMS filter over a grid of noise amplitudes, learning
+#       rates, filter orders and engines, and writes one tidy table
+#       with the error metrics of every cell. the noisy signal and the
+#       reference noise are generated once per (recording, amplitude,
+#       seed) and shared by every filter setting, and the groups are
+#       spread over a process pool, one task per group
+#
+#   Preconditions: Data folder is formatted as described in
+#       processAudio.py
+#
+#   Postconditions: a csv file with one row per (recording, amplitude,
+#       seed, engine, lRate, fOrder) has been written. no audio files
+#       are written or changed
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+#import dependencies
+import csv
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import audioIO
+import audioMetrics
+import processAudio
+import resultsStore
+
+# columns of the results table, in order
+columns = ["sentence", "recording", "amp", "seed", "noise", "engine", "lRate", "fOrder",
+           "noisy_percent_error", "noisy_snr", "noisy_seg_snr", "noisy_spectral_distortion",
+           "percent_error", "snr", "seg_snr", "spectral_distortion", "seconds"]
+
+# every combination of the filter settings as (engine, lRate, fOrder)
+def buildGrid(lRates=[0.01], fOrders=[100], engines=["block"]):
+    return list(itertools.product(engines, lRates, fOrders))
+
+# reads the original and generates the noisy signal and reference noise
+#   the same way processAudio.noisify and processAudio.LMS do for seed
+def makeGroup(job, seed):
+    sRate, audioData = audioIO.readWav(job["original"])
+    jobSeed = processAudio.noiseSeed(seed, job["sentence"], job["recording"], job["amp"])
+    noisyAudio, reference = processAudio.noisySignals(audioData, job["amp"], jobSeed, sRate, job["noise"], job["noiseSource"])
+    return {"sRate": sRate, "audioData": audioData, "noisyAudio": noisyAudio, "reference": reference}
+
+# filters one group with each of the given settings, returns table rows.
+#   the group's noisy signal and reference are generated once for all of
+#   them
+def sweepGroup(job, seed, settings, engineArgs={}):
+    group = makeGroup(job, seed)
+    # the signals are normalized, the scale parselmouth reads wav files at
+    original = group["audioData"]
+    noisy = audioMetrics.compare(original, group["noisyAudio"], group["sRate"])
+    rows = []
+    for engine, lRate, fOrder in settings:
+        start = time.perf_counter()
+        args = engineArgs.get(engine, {})
+        filteredAudio = processAudio.engines[engine](group["noisyAudio"], group["reference"], lRate, fOrder, **args)
+        seconds = time.perf_counter() - start
+        filtered = audioMetrics.compare(original, audioIO.quantize(filteredAudio), group["sRate"])
+        row = {"sentence": job["sentence"], "recording": job["recording"], "amp": job["amp"],
+               "seed": seed, "noise": job["noise"], "engine": engine, "lRate": lRate, "fOrder": fOrder, "seconds": seconds}
+        for metric, value in noisy.items():
+            row["noisy_" + metric] = value
+        row.update(filtered)
+        rows.append(row)
+    return rows
+
+# runs the whole grid for every recording in dataDir and writes the
+#   results to outFile. each task filters one group with every setting of
+#   the grid, so its noise is generated once. engineArgs maps an engine
+#   name to extra keyword arguments for it, e.g. {"block": {"blockSize":
+#   64}}. with a dbPath the rows are also written to that results store.
+#   noiseType and noiseSource pick the noise, see processAudio.noiseTypes
+def runSweep(dataDir="Data", amplitudes=[0.05, 0.25, 0.5], grid=None, seeds=[0], workers=None,
+             outFile="sweep_results.csv", engineArgs={}, dbPath=None,
+             noiseType="white", noiseSource=None):
+    grid = grid if grid is not None else buildGrid()
+    for engine, _, _ in grid:
+        if engine not in processAudio.engines:
+            print(f'ERROR: unknown LMS engine "{engine}", exiting sweep...')
+            return []
+    jobs = processAudio.buildJobs(dataDir, amplitudes, noiseType=noiseType, noiseSource=noiseSource)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for job, seed in itertools.product(jobs, seeds):
+            future = pool.submit(sweepGroup, job, seed, grid, engineArgs)
+            futures[future] = job
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                print(f"FAILED: {job['recording']} at {job['amp']} ({type(e).__name__}: {e})")
+    rows.sort(key=lambda r: [r[c] for c in columns[:8]])
+    with open(outFile, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    if dbPath is not None:
+        writeStore(rows, dbPath, engineArgs)
+    print(f"{len(rows)} of {len(jobs) * len(seeds) * len(grid)} cells written to {outFile}")
+    return rows
+
+# writes sweep rows to a results store, one row per signal
+def writeStore(rows, dbPath, engineArgs={}):
+    storeRows = []
+    for row in rows:
+        params = {"lRate": row["lRate"], "fOrder": row["fOrder"], "seed": row["seed"],
+                  "engineArgs": engineArgs.get(row["engine"], {})}
+        if row["noise"] != "white":
+            params["noise"] = row["noise"]
+        noisy = {m: row["noisy_" + m] for m in resultsStore.metrics}
+        filtered = {m: row[m] for m in resultsStore.metrics}
+        for signal, values in (("noisy", noisy), ("filtered", filtered)):
+            storeRows.append(resultsStore.make_row("sweep", row["sentence"], row["recording"], row["amp"],
+                                                   row["engine"], params, signal, values))
+    conn = resultsStore.connect(dbPath)
+    resultsStore.write_rows(conn, storeRows)
+    conn.close()
+
+def main():
+    # learning rates around the pipeline default of 0.01
+    grid = buildGrid(lRates=[1e-3, 3e-3, 1e-2, 3e-2], fOrders=[32, 100, 512, 1024], engines=["block", "fdaf"])
+    runSweep("Data", [0.05, 0.25, 0.5], grid)
+    return True
+
+if __name__ == "__main__":
+    main()
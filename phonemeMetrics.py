@@ -0,0 +1,61 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   phonemeMetrics.py
+#       vectorized phoneme error rate: the edit distance (substitutions,
+#       insertions and deletions) between decoded and reference Arpabet
+#       sequences, divided by the reference length. a whole batch of
+#       pairs is scored at once, the dynamic programming rows of every
+#       pair are advanced together as one (pairs x hypothesis length)
+#       array, one reference phoneme at a time
+#
+#   Preconditions: sequences are lists of Arpabet symbols, stress digits
+#       are ignored (AE1 and AE are the same phoneme)
+#
+#   Postconditions: an array of distances or rates is returned, inputs
+#       are unchanged
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import numpy as np
+
+# a phoneme without its stress digit, e.g. "AE1" -> "AE"
+def strip_stress(phoneme: str):
+    return phoneme.rstrip("012")
+
+# maps every sequence to ids, padded into a (sequences x longest) array.
+#   padding uses pad, which must differ from every id and from the other
+#   array's padding so padded positions never match
+def encode(sequences: list, vocab: dict, pad: int):
+    lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+    ids = np.full((len(sequences), max(lengths.max(initial=0), 1)), pad, dtype=np.int64)
+    for i, seq in enumerate(sequences):
+        ids[i, :len(seq)] = [vocab.setdefault(strip_stress(p), len(vocab)) for p in seq]
+    return ids, lengths
+
+# edit distance of every (reference, hypothesis) pair
+def edit_distances(references: list, hypotheses: list):
+    vocab = {}
+    ref, ref_lengths = encode(references, vocab, -1)
+    hyp, hyp_lengths = encode(hypotheses, vocab, -2)
+    columns = np.arange(hyp.shape[1] + 1)
+    # row i holds the distances from the first i reference phonemes to
+    #   every prefix of the hypothesis
+    row = np.tile(columns, (len(references), 1))
+    for i in range(ref.shape[1]):
+        current = np.empty_like(row)
+        current[:, 0] = i + 1
+        np.minimum(row[:, :-1] + (ref[:, i, None] != hyp), row[:, 1:] + 1, out=current[:, 1:])
+        # insertions chain along the row: current[j] = min(current[j],
+        #   current[j - 1] + 1), a running minimum of current - j
+        current = np.minimum.accumulate(current - columns, axis=1) + columns
+        # pairs whose reference has ended keep their last row
+        row = np.where((i < ref_lengths)[:, None], current, row)
+    return row[np.arange(len(references)), hyp_lengths]
+
+# phoneme error rate of every pair, the edit distance over the reference
+#   length (nan for an empty reference)
+def error_rates(references: list, hypotheses: list):
+    lengths = np.array([len(r) for r in references], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(lengths > 0, edit_distances(references, hypotheses) / lengths, np.nan)
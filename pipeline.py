@@ -0,0 +1,130 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   pipeline.py
+#       one command line entry point for every stage of the pipeline:
+#
+#           python pipeline.py noisify
+#           python pipeline.py filter --engine block
+#           python pipeline.py analyze
+#           python pipeline.py plot
+#           python pipeline.py transcribe
+#           python pipeline.py merge --nodes 4
+#
+#       each subcommand imports the modules it runs only once it runs,
+#       so --help and the light stages start quickly and their worker
+#       processes never load plotting or speech libraries. the global
+#       options are passed on through the environment variables the
+#       modules read (AUDIO_RATE, AUDIO_DTYPE, AUDIO_TRACE and
+#       AUDIO_PROFILE), which pool workers inherit
+#
+#   Preconditions: Data folder is formatted as described in
+#       processAudio.py
+#
+#   Postconditions: the chosen stage has been run on the Data folder
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+#import dependencies
+import argparse
+import os
+import sys
+
+# the module each subcommand runs, imported only when it is used
+commandModules = {"noisify": "processAudio",
+                  "filter": "processAudio",
+                  "analyze": "processData",
+                  "plot": "processData",
+                  "transcribe": "processTranscripts",
+                  "merge": "processData"}
+
+# the subcommands. each takes the parsed arguments and returns whether it
+#   succeeded
+def runNoisify(args):
+    import processAudio
+    return processAudio.main(workers=args.workers, force=args.force, chunkSize=args.chunk_size, seed=args.seed,
+                             node=args.node, nodes=args.nodes, stages=("noisify",),
+                             noiseType=args.noise, noiseSource=args.noise_source, sharedNoise=args.shared_noise)
+
+def runFilter(args):
+    import processAudio
+    engineArgs = {"blockSize": args.block_size} if args.block_size else {}
+    return processAudio.main(args.engine, args.lrate, args.order, args.workers, args.force, args.chunk_size,
+                             args.seed, args.target, args.node, args.nodes, stages=("filter",),
+                             noiseType=args.noise, noiseSource=args.noise_source, sharedNoise=args.shared_noise, **engineArgs)
+
+def runAnalyze(args):
+    import processData
+    return processData.main(args.force, args.workers, args.node, args.nodes, figures=False)
+
+def runPlot(args):
+    import processData
+    return processData.plot(args.workers, node=args.node, nodes=args.nodes)
+
+def runTranscribe(args):
+    import processTranscripts
+    return processTranscripts.main(args.force, args.workers, batch_size=args.batch_size, out_file=args.output)
+
+def runMerge(args):
+    import processData
+    return processData.merge(args.nodes)
+
+# a noise seed, "none" for fresh noise on every run
+def seedArg(value):
+    return None if value.lower() == "none" else int(value)
+
+def buildParser():
+    parser = argparse.ArgumentParser(description="noisify, filter, analyze, plot and transcribe the recordings in Data")
+    parser.add_argument("--rate", type=int, help="resample every recording to this rate as it is decoded")
+    parser.add_argument("--dtype", choices=["float32", "float64"], help="working sample type")
+    parser.add_argument("--trace", help="append a stage trace to this file")
+    parser.add_argument("--profile", help="write a cProfile dump of every job to this folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # options most stages share
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, default=None, help="worker processes, every cpu core by default")
+    rerun = argparse.ArgumentParser(add_help=False)
+    rerun.add_argument("--force", action="store_true", help="rerun jobs whose inputs haven't changed")
+    shard = argparse.ArgumentParser(add_help=False)
+    shard.add_argument("--node", type=int, default=0, help="the shard of the recordings to process")
+    shard.add_argument("--nodes", type=int, default=1, help="number of shards the recordings are split into")
+    audio = argparse.ArgumentParser(add_help=False)
+    audio.add_argument("--seed", type=seedArg, default=0, help='batch noise seed, "none" for fresh noise')
+    audio.add_argument("--noise", choices=["white", "pink", "babble"], default="white", help="type of noise added")
+    audio.add_argument("--noise-source", help="recording the babble noise is taken from")
+    audio.add_argument("--shared-noise", action="store_true", help="scale one noise to every amplitude of a recording")
+    audio.add_argument("--chunk-size", type=int, default=None, help="stream each recording in chunks of this many samples")
+
+    noisify = commands.add_parser("noisify", parents=[common, rerun, shard, audio], help="write the noisy recordings")
+    noisify.set_defaults(run=runNoisify)
+    filt = commands.add_parser("filter", parents=[common, rerun, shard, audio], help="filter the noisy recordings")
+    filt.add_argument("--engine", default="sample", help='LMS engine, or "auto" to pick the fastest converging one')
+    filt.add_argument("--lrate", type=float, default=0.01, help="LMS learning rate")
+    filt.add_argument("--order", type=int, default=100, help="LMS filter order")
+    filt.add_argument("--block-size", type=int, default=None, help="block size of the block engines")
+    filt.add_argument("--target", type=float, default=0.1, help="convergence target of the auto engine")
+    filt.set_defaults(run=runFilter)
+    analyze = commands.add_parser("analyze", parents=[common, rerun, shard], help="compute the error metrics and analysis files")
+    analyze.set_defaults(run=runAnalyze)
+    plot = commands.add_parser("plot", parents=[common, shard], help="draw the waveform and spectrogram figures")
+    plot.set_defaults(run=runPlot)
+    transcribe = commands.add_parser("transcribe", parents=[common, rerun], help="transcribe to Arpabet and score the phoneme error rate")
+    transcribe.add_argument("--batch-size", type=int, default=8, help="recordings sent to a worker at a time")
+    transcribe.add_argument("--output", default="phoneme_error_rates.csv", help="where to write the phoneme error rate table")
+    transcribe.set_defaults(run=runTranscribe)
+    merge = commands.add_parser("merge", help="merge the manifests and results of a sharded run and write the averages")
+    merge.add_argument("--nodes", type=int, required=True, help="number of shards the run was split into")
+    merge.set_defaults(run=runMerge)
+    return parser
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    for name, value in (("AUDIO_RATE", args.rate), ("AUDIO_DTYPE", args.dtype),
+                        ("AUDIO_TRACE", args.trace), ("AUDIO_PROFILE", args.profile)):
+        if value is not None:
+            os.environ[name] = str(value)
+    return args.run(args)
+
+if __name__ == "__main__":
+    # a failed stage exits non-zero so scripts and schedulers notice
+    sys.exit(0 if main() else 1)
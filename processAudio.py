@@ -2,7 +2,10 @@
 #
 #   processAudio.py
 #       noisifies, then filters the audio samples, saving the noisy,
-#           filtered, and reference noise signals as sound files
+#           filtered, and reference noise signals as sound files.
+#           recordings may have any number of channels, which are
+#           filtered together, and are resampled to the canonical rate
+#           if one is set (see audioIO)
 #
 #   Preconditions: Data folder is formatted as shown below:
 #       sentence folder names can be arbitrary but must have subfolders
@@ -15,8 +18,12 @@
 #           |   |_[%noiseAmplitude]_percent
 #           |   |   |filtered
 #           |   |   |noisy
+#           |   |   |noise_references
 #           |   |... (repeat for number of amplitudes to study)
 #
+#       only _0riginal/audio has to exist, the other folders are created
+#       as needed (see dataLayout.py)
+#
 #   Postconditions: all audio files in all sentence folders will have
 #       been noisified, filtered, and then stored in their respective
 #       folders
@@ -27,19 +34,115 @@
 #""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
 #import dependencies
+import inspect
+import json
 import numpy as np
-import scipy.io.wavfile as wf
 import os
 import os.path as path
+import time
+import zlib
+import audioIO
+import backgroundIO
+import buildManifest
+import dataLayout
+import stageTrace
+import streamAudio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# the seed of the noise for one (recording, amplitude), derived from the
+#   batch seed with a stable hash so every process derives the same value
+def noiseSeed(seed, sentence, recording, amp):
+    return [seed, zlib.crc32(f"{sentence}/{recording}".encode()), int(round(amp * 10000))]
+
+# the number of channels of audioData, None for a mono (1-d) signal.
+#   multi-channel signals are (channels x samples) arrays, see audioIO
+def channelsOf(audioData):
+    return None if np.ndim(audioData) == 1 else np.shape(audioData)[0]
+
+# unit variance white noise for a noise seed, in the working dtype, with
+#   one row per channel when channels is given. the generator is created
+#   fresh each time, so the same seed always gives the same samples. they
+#   are drawn in float64 so every dtype gets the same noise, and a frame
+#   (all channels) at a time so streamAudio can draw them chunk by chunk
+def makeNoise(seed, nSamples, channels=None):
+    shape = nSamples if channels is None else (nSamples, channels)
+    return np.ascontiguousarray(np.random.default_rng(seed).standard_normal(shape).astype(audioIO.dtype).T)
+
+# fresh (unseeded) noise shaped like makeNoise, from the global generator
+def freshNoise(nSamples, channels=None):
+    shape = nSamples if channels is None else (nSamples, channels)
+    return np.ascontiguousarray(np.random.normal(0, 1, shape).astype(audioIO.dtype).T)
+
+# unit variance noise of each type, shaped like makeNoise. each takes the
+#   seed (None for fresh noise), the length, the channels, the sample rate
+#   of the recording and the noise source file (babble only)
+def whiteNoise(seed, nSamples, channels=None, sRate=None, source=None):
+    return freshNoise(nSamples, channels) if seed is None else makeNoise(seed, nSamples, channels)
+
+# white noise shaped to a 1/f power spectrum in the frequency domain
+def pinkNoise(seed, nSamples, channels=None, sRate=None, source=None):
+    spectrum = np.fft.rfft(whiteNoise(seed, nSamples, channels), axis=-1)
+    freqs = np.arange(spectrum.shape[-1], dtype=np.float64)
+    freqs[0] = 1.0
+    pink = np.fft.irfft(spectrum / np.sqrt(freqs), n=nSamples, axis=-1)
+    pink -= pink.mean(axis=-1, keepdims=True)
+    return np.ascontiguousarray((pink / pink.std(axis=-1, keepdims=True)).astype(audioIO.dtype))
+
+# decoded babble recordings by (file, rate), kept for the life of the process
+babbleCache = {}
 
-def noisify(inFile: str, outFile: str, amp = 0.1):
+# segments of a babble recording (several people talking), mixed to mono
+#   and resampled to sRate, starting at a random offset per channel and
+#   wrapping around when the recording is shorter than the signal
+def babbleNoise(seed, nSamples, channels=None, sRate=None, source=None):
+    if source is None:
+        raise ValueError("babble noise needs a noise source file")
+    key = (path.abspath(source), sRate)
+    if key not in babbleCache:
+        fileRate, babble = audioIO.readWav(source)
+        babble = audioIO.resample(babble, fileRate, sRate or fileRate)
+        if babble.ndim > 1:
+            babble = babble.mean(axis=0)
+        babble = babble - babble.mean()
+        babbleCache[key] = (babble / babble.std()).astype(audioIO.dtype)
+    babble = babbleCache[key]
+    offsets = np.random.default_rng(seed).integers(len(babble), size=channels or 1)
+    noise = np.take(babble, offsets[:, None] + np.arange(nSamples), mode="wrap")
+    return noise[0] if channels is None else noise
+
+noiseTypes = {
+    "white": whiteNoise,
+    "pink": pinkNoise,
+    "babble": babbleNoise,
+}
+
+# the noise of a job, one sample longer than the recording: noisify adds
+#   the first nSamples and LMS adapts against the last nSamples, the same
+#   noise advanced by one sample, so the window of fOrder samples the
+#   engines use for sample n ends with the noise added at n
+def jobNoise(seed, nSamples, channels=None, sRate=None, noiseType="white", noiseSource=None):
+    return noiseTypes[noiseType](seed, nSamples + 1, channels, sRate, noiseSource)
+
+# adds noise scaled to amp times the peak of the recording. with a seed
+#   (see noiseSeed) the noise is reproducible and LMS can regenerate it as
+#   its reference, without one fresh random noise is used. noiseType picks
+#   one of noiseTypes, babble is read from noiseSource
+def noisify(inFile: str, outFile: str, amp = 0.1, seed=None, noiseType="white", noiseSource=None):
     if path.isfile(inFile) and inFile.endswith(".wav"):
         outFile = outFile.replace(".wav", f"_{int(amp*100)}_noisy.wav")
-        sRate, audioData = wf.read(inFile)
-        noise = np.random.normal(0, 1, len(audioData))
-        noise = noise * amp * max(abs(audioData))
-        noisyAudio = audioData + noise
-        wf.write(outFile, sRate, noisyAudio.astype(np.int16))
+        with stageTrace.stage("decode", file=inFile):
+            stageTrace.read_file(inFile)
+            sRate, audioData = audioIO.readWav(inFile)
+        nSamples, channels = audioData.shape[-1], channelsOf(audioData)
+        with stageTrace.stage("noise", samples=nSamples):
+            noise = jobNoise(seed, nSamples, channels, sRate, noiseType, noiseSource)[..., :nSamples]
+            # scaled to the peak over every channel
+            noise = noise * amp * np.max(np.abs(audioData))
+            noisyAudio = audioData + noise
+        with stageTrace.stage("write", file=outFile):
+            # peaks past full scale are clipped, not wrapped around
+            audioIO.writeWav(outFile, sRate, noisyAudio)
+            stageTrace.wrote_file(outFile)
 
         if path.exists(outFile):
             return True
@@ -50,53 +153,674 @@ def noisify(inFile: str, outFile: str, amp = 0.1):
         print('ERROR: problem reading from file or incorrect file type, exiting noisify...')
         return False
 
-# applies a least mean squares filter to the sound indicated by inFile
-def LMS(inFile: str, outFile: str, ref_out: str, amp = 0.1, lRate=0.01, fOrder=100):
-    sRate, audioData = wf.read(inFile)
+# every engine filters a mono signal or all channels of a (channels x
+#   samples) signal at once, each channel with its own coefficients. this
+#   returns both signals as (channels x samples) arrays, a mono reference
+#   is shared by every channel
+def asChannels(audioData, reference):
+    audioData = np.atleast_2d(audioData)
+    return audioData, np.broadcast_to(np.atleast_2d(reference), audioData.shape)
+
+# the (channels x windows x fOrder) windows of the reference. window n -
+#   fOrder of a channel is reference[n - fOrder:n], the input vector the
+#   engines use for sample n (a view, no copying)
+def referenceWindows(reference, fOrder):
+    return np.lib.stride_tricks.sliding_window_view(reference, fOrder, axis=-1)
+
+# reference LMS engine: adapts the filter coefficients once per sample
+def sampleLMS(audioData, reference, lRate=0.01, fOrder=100):
+    shape = np.shape(audioData)
+    audioData, reference = asChannels(audioData, reference)
+    work = audioIO.workType(audioData, reference)
+    filtCoef = np.zeros((len(audioData), fOrder), dtype=work)
+    filteredAudio = np.zeros(audioData.shape, dtype=work)
+
+    for n in range(fOrder, audioData.shape[1] - 100):
+        noiseInput = reference[:, n - fOrder:n]
+        filtOutput = np.einsum("cf,cf->c", filtCoef, noiseInput)
+        error = audioData[:, n] - filtOutput
+        filtCoef += lRate * error[:, None] * noiseInput
+        filteredAudio[:, n] = error
+    return filteredAudio.reshape(shape)
+
+# block LMS engine: filters blockSize samples at a time with the same
+#   coefficients, then adapts them once using the mean gradient of the
+#   block, so the step is stable at the same lRate as sampleLMS.
+#   blockSize=1 reproduces sampleLMS (to rounding); larger blocks trade
+#   a slower adaptation for far fewer python-level iterations
+def blockLMS(audioData, reference, lRate=0.01, fOrder=100, blockSize=256):
+    shape = np.shape(audioData)
+    audioData, reference = asChannels(audioData, reference)
+    work = audioIO.workType(audioData, reference)
+    filtCoef = np.zeros((len(audioData), fOrder), dtype=work)
+    filteredAudio = np.zeros(audioData.shape, dtype=work)
+    windows = referenceWindows(reference, fOrder)
+    end = audioData.shape[1] - 100
 
-    reference = np.random.normal(0, 1, len(audioData))
+    for start in range(fOrder, end, blockSize):
+        stop = min(start + blockSize, end)
+        noiseInput = windows[:, start - fOrder:stop - fOrder]
+        filtOutput = (noiseInput @ filtCoef[:, :, None])[:, :, 0]
+        error = audioData[:, start:stop] - filtOutput
+        filtCoef += lRate / blockSize * (error[:, None, :] @ noiseInput)[:, 0, :]
+        filteredAudio[:, start:stop] = error
+    return filteredAudio.reshape(shape)
 
-    filtCoef = np.zeros(fOrder)
-    filteredAudio = np.zeros(len(audioData))
+# frequency domain (overlap-save) LMS engine: the same update as blockLMS
+#   with blockSize=fOrder, but the filtering and gradient correlations are
+#   done with FFTs of length 2*fOrder, so each sample costs O(log fOrder)
+#   instead of O(fOrder). Intended for high filter orders (512 and up)
+def fdafLMS(audioData, reference, lRate=0.01, fOrder=100):
+    shape = np.shape(audioData)
+    audioData, reference = asChannels(audioData, reference)
+    work = audioIO.workType(audioData, reference)
+    filtCoef = np.zeros((len(audioData), fOrder), dtype=work)
+    filteredAudio = np.zeros(audioData.shape, dtype=work)
+    fftSize = 2 * fOrder
+    end = audioData.shape[1] - 100
 
-    for n in range(fOrder, len(audioData) - 100):
-        noiseInput = reference[n - fOrder:n]
-        filtOutput = np.dot(filtCoef, noiseInput)
-        error = audioData[n] - filtOutput
-        filtCoef += lRate * error * noiseInput
-        filteredAudio[n] = audioData[n] - filtOutput
+    for start in range(fOrder, end, fOrder):
+        stop = min(start + fOrder, end)
+        # the previous fOrder reference samples plus the current block,
+        #   zero padded if the final block is short
+        noiseInput = np.zeros((len(audioData), fftSize), dtype=work)
+        noiseInput[:, :fOrder + stop - start] = reference[:, start - fOrder:stop]
+        noiseSpec = np.fft.rfft(noiseInput)
+        # correlate the coefficients with the input to get the filter output
+        coefSpec = np.fft.rfft(filtCoef, fftSize)
+        filtOutput = np.fft.irfft(noiseSpec * np.conj(coefSpec), fftSize)[:, :stop - start]
+        error = audioData[:, start:stop] - filtOutput
+        # correlate the error with the input to get the block gradient,
+        #   keeping only the first fOrder lags (gradient constraint)
+        errorSpec = np.fft.rfft(error, fftSize)
+        filtCoef += lRate / fOrder * np.fft.irfft(noiseSpec * np.conj(errorSpec), fftSize)[:, :fOrder]
+        filteredAudio[:, start:stop] = error
+    return filteredAudio.reshape(shape)
 
-    wf.write(ref_out.replace(".wav", f"_{int(amp * 100)}_noise_ref.wav"), sRate, np.int16(reference))
-    wf.write(outFile.replace(".wav", f"_{int(amp * 100)}_filtered.wav"), sRate, np.int16(filteredAudio))
+# normalized LMS engine: sampleLMS with the step divided by the energy of
+#   the input window, so lRate (0 < lRate < 2) behaves the same whatever
+#   the level of the signal and reference
+def sampleNLMS(audioData, reference, lRate=0.01, fOrder=100, eps=1e-6):
+    shape = np.shape(audioData)
+    audioData, reference = asChannels(audioData, reference)
+    work = audioIO.workType(audioData, reference)
+    filtCoef = np.zeros((len(audioData), fOrder), dtype=work)
+    filteredAudio = np.zeros(audioData.shape, dtype=work)
+
+    for n in range(fOrder, audioData.shape[1] - 100):
+        noiseInput = reference[:, n - fOrder:n]
+        filtOutput = np.einsum("cf,cf->c", filtCoef, noiseInput)
+        error = audioData[:, n] - filtOutput
+        energy = np.einsum("cf,cf->c", noiseInput, noiseInput)
+        filtCoef += lRate * (error / (eps + energy))[:, None] * noiseInput
+        filteredAudio[:, n] = error
+    return filteredAudio.reshape(shape)
+
+# block normalized LMS engine: blockLMS with the summed gradient divided
+#   by the summed energy of the block's input windows, stable for
+#   0 < lRate < 2 at any block size. blockSize=1 reproduces sampleNLMS
+def blockNLMS(audioData, reference, lRate=0.01, fOrder=100, blockSize=256, eps=1e-6):
+    shape = np.shape(audioData)
+    audioData, reference = asChannels(audioData, reference)
+    work = audioIO.workType(audioData, reference)
+    filtCoef = np.zeros((len(audioData), fOrder), dtype=work)
+    filteredAudio = np.zeros(audioData.shape, dtype=work)
+    windows = referenceWindows(reference, fOrder)
+    end = audioData.shape[1] - 100
+
+    for start in range(fOrder, end, blockSize):
+        stop = min(start + blockSize, end)
+        noiseInput = windows[:, start - fOrder:stop - fOrder]
+        error = audioData[:, start:stop] - (noiseInput @ filtCoef[:, :, None])[:, :, 0]
+        energy = np.sum(noiseInput * noiseInput, axis=(1, 2))
+        filtCoef += lRate * (error[:, None, :] @ noiseInput)[:, 0, :] / (eps + energy)[:, None]
+        filteredAudio[:, start:stop] = error
+    return filteredAudio.reshape(shape)
+
+# recursive least squares engine: each sample the coefficients become the
+#   exact least squares solution over all past samples, weighted by
+#   forgetting per sample of age. converges in a few fOrder samples but
+#   costs O(fOrder^2) per sample. RLS has no step size, lRate is unused.
+#   the coefficients and correlations are kept in float64 whatever the
+#   working dtype, RLS loses stability in float32
+def sampleRLS(audioData, reference, lRate=0.01, fOrder=100, forgetting=0.9999, delta=0.01):
+    shape = np.shape(audioData)
+    audioData, reference = asChannels(audioData, reference)
+    channels = len(audioData)
+    filtCoef = np.zeros((channels, fOrder))
+    filteredAudio = np.zeros(audioData.shape, dtype=audioIO.workType(audioData, reference))
+    # inverse of the weighted input correlation, regularized by delta
+    invCorr = np.tile(np.eye(fOrder) / delta, (channels, 1, 1))
+
+    for n in range(fOrder, audioData.shape[1] - 100):
+        noiseInput = reference[:, n - fOrder:n]
+        corrInput = (invCorr @ noiseInput[:, :, None])[:, :, 0]
+        gain = corrInput / (forgetting + np.einsum("cf,cf->c", noiseInput, corrInput))[:, None]
+        error = audioData[:, n] - np.einsum("cf,cf->c", filtCoef, noiseInput)
+        filtCoef += gain * error[:, None]
+        invCorr = (invCorr - gain[:, :, None] * corrInput[:, None, :]) / forgetting
+        # keep it symmetric, rounding errors otherwise build up until the
+        #   filter diverges
+        invCorr = (invCorr + invCorr.transpose(0, 2, 1)) / 2
+        filteredAudio[:, n] = error
+    return filteredAudio.reshape(shape)
+
+# block RLS engine: filters blockSize samples with the same coefficients,
+#   then adds the block to the weighted correlation matrix and solves for
+#   the least squares coefficients once. blockSize=1 gives the same
+#   coefficients as sampleRLS, larger blocks replace the per-sample
+#   python loop with matrix products and one solve per block
+def blockRLS(audioData, reference, lRate=0.01, fOrder=100, blockSize=256, forgetting=0.9999, delta=0.01):
+    shape = np.shape(audioData)
+    audioData, reference = asChannels(audioData, reference)
+    channels = len(audioData)
+    filtCoef = np.zeros((channels, fOrder))
+    filteredAudio = np.zeros(audioData.shape, dtype=audioIO.workType(audioData, reference))
+    windows = referenceWindows(reference, fOrder)
+    end = audioData.shape[1] - 100
+    # weighted input correlation and input/signal cross correlation
+    corr = np.tile(delta * np.eye(fOrder), (channels, 1, 1))
+    cross = np.zeros((channels, fOrder))
+
+    for start in range(fOrder, end, blockSize):
+        stop = min(start + blockSize, end)
+        noiseInput = windows[:, start - fOrder:stop - fOrder]
+        error = audioData[:, start:stop] - (noiseInput @ filtCoef[:, :, None])[:, :, 0]
+        # the newest sample in the block has weight 1
+        weighted = noiseInput.transpose(0, 2, 1) * forgetting ** np.arange(stop - start - 1, -1, -1)
+        corr = forgetting ** (stop - start) * corr + weighted @ noiseInput
+        cross = forgetting ** (stop - start) * cross + (weighted @ audioData[:, start:stop, None])[:, :, 0]
+        filtCoef = np.linalg.solve(corr, cross[:, :, None])[:, :, 0]
+        filteredAudio[:, start:stop] = error
+    return filteredAudio.reshape(shape)
+
+# available adaptive filter engines, selected by name in LMS
+engines = {
+    "sample": sampleLMS,
+    "block": blockLMS,
+    "fdaf": fdafLMS,
+    "nlms": sampleNLMS,
+    "block-nlms": blockNLMS,
+    "rls": sampleRLS,
+    "block-rls": blockRLS,
+}
+
+# applies an adaptive filter (least mean squares by default) to the
+#   sound indicated by inFile. engine selects the algorithm and
+#   implementation from engines, extra keyword arguments (e.g.
+#   blockSize) are passed on to that engine. seed should be the seed
+#   noisify was given, so the filter adapts against the noise that was
+#   actually added. without one the reference is fresh noise
+def LMS(inFile: str, outFile: str, ref_out: str, amp = 0.1, lRate=0.01, fOrder=100, engine="sample", seed=None,
+        noiseType="white", noiseSource=None, **engineArgs):
+    if engine not in engines:
+        print(f'ERROR: unknown LMS engine "{engine}", exiting LMS...')
+        return False
+    with stageTrace.stage("decode", file=inFile):
+        stageTrace.read_file(inFile)
+        sRate, audioData = audioIO.readWav(inFile)
+
+    # every channel is filtered against its own channel of the noise
+    nSamples, channels = audioData.shape[-1], channelsOf(audioData)
+    with stageTrace.stage("noise", samples=nSamples):
+        reference = jobNoise(seed, nSamples, channels, sRate, noiseType, noiseSource)[..., 1:]
+
+    with stageTrace.stage("lms", engine=engine, fOrder=fOrder, samples=nSamples, channels=channels or 1):
+        filteredAudio = engines[engine](audioData, reference, lRate, fOrder, **engineArgs)
+
+    refFile = ref_out.replace(".wav", f"_{int(amp * 100)}_noise_ref.wav")
+    filtFile = outFile.replace(".wav", f"_{int(amp * 100)}_filtered.wav")
+    with stageTrace.stage("write", file=filtFile):
+        # the unit variance reference is written at one 16-bit step per
+        #   unit, as it always has been
+        audioIO.writeWav(refFile, sRate, reference / audioIO.fullScale)
+        audioIO.writeWav(filtFile, sRate, filteredAudio)
+        stageTrace.wrote_file(refFile)
+        stageTrace.wrote_file(filtFile)
     return True
 
+# the noisy signals noisify writes for audioData at every amplitude in
+#   amps (as LMS reads them back) and the references LMS filters them
+#   against, one per amplitude, for each amplitude's noise seed. the
+#   recording's peak is taken once and every level is scaled, added and
+#   quantized as one (amplitudes x channels x samples) array, jobs that
+#   share a seed share one noise draw (see buildJobs' sharedNoise), a
+#   single draw is broadcast over every level. without a seed the noise
+#   is fresh
+def noisyLevels(audioData, amps, seeds, sRate=None, noiseType="white", noiseSource=None):
+    nSamples, channels = audioData.shape[-1], channelsOf(audioData)
+    # seeds are lists (see noiseSeed), fresh noise is never shared
+    draws = {}
+    for i, seed in enumerate(seeds):
+        key = i if seed is None else repr(seed)
+        if key not in draws:
+            draws[key] = jobNoise(seed, nSamples, channels, sRate, noiseType, noiseSource)
+    if len(draws) == 1:
+        noise = next(iter(draws.values()))[None]
+    else:
+        noise = np.stack([draws[i if seed is None else repr(seed)] for i, seed in enumerate(seeds)])
+    # promoted as noise * amp is in noisify, so every level rounds the same
+    scale = np.asarray(amps, dtype=np.result_type(noise, *amps)).reshape((-1,) + (1,) * audioData.ndim)
+    noisyAudio = audioIO.quantize(audioData + noise[..., :nSamples] * scale * np.max(np.abs(audioData)))
+    return noisyAudio, np.broadcast_to(noise[..., 1:], noisyAudio.shape)
+
+# the noisy signal and reference of a single amplitude, see noisyLevels
+def noisySignals(audioData, amp, seed, sRate=None, noiseType="white", noiseSource=None):
+    noisyAudio, references = noisyLevels(audioData, [amp], [seed], sRate, noiseType, noiseSource)
+    return noisyAudio[0], references[0]
 
-def main():
+# noisifies one recording at every amplitude in amps in one pass: it is
+#   decoded once and each level is written to the matching file in
+#   outFiles on background threads. seeds gives each level's noise seed
+#   (all None for fresh noise)
+def noisifyLevels(inFile: str, outFiles: list, amps: list, seeds=None, noiseType="white", noiseSource=None):
+    if len(outFiles) != len(amps):
+        print('ERROR: one output file is needed per amplitude, exiting noisifyLevels...')
+        return False
+    with stageTrace.stage("decode", file=inFile):
+        stageTrace.read_file(inFile)
+        sRate, audioData = audioIO.readWav(inFile)
+    seeds = seeds if seeds is not None else [None] * len(amps)
+    with stageTrace.stage("noise", samples=audioData.shape[-1], levels=len(amps)):
+        noisyAudio, _ = noisyLevels(audioData, amps, seeds, sRate, noiseType, noiseSource)
+    dataLayout.make_parents(*outFiles)
+    with backgroundIO.BackgroundIO() as io:
+        writes = [io.submit(writeOutput, outFile, sRate, level) for outFile, level in zip(outFiles, noisyAudio)]
+    for outFile, future in zip(outFiles, writes):
+        if future.exception() is not None:
+            print(f'ERROR: could not write {outFile} ({future.exception()}), exiting noisifyLevels...')
+            return False
+    return True
+
+# the first sample from which the noise left in filteredAudio is at or
+#   below target times the noise that was added for `hold` windows of
+#   `window` samples in a row, over every channel. None if the filter
+#   never gets there
+def convergenceSample(original, noisyAudio, filteredAudio, fOrder=100, target=0.1, window=1024, hold=3):
+    # the engines leave the first fOrder and last 100 samples unfiltered
+    start, end = fOrder, np.shape(original)[-1] - 100
+    nWindows = (end - start) // window
+    stop = start + nWindows * window
+    original = np.asarray(original[..., start:stop], dtype=float)
+    # (channels x windows x window) power, averaged over channels
+    power = lambda signal: np.mean((signal - original).reshape(-1, nWindows, window) ** 2, axis=(0, 2))
+    below = power(filteredAudio[..., start:stop]) <= target * power(noisyAudio[..., start:stop])
+    # windows that start a run of hold windows below target
+    runs = np.nonzero(np.convolve(below, np.ones(hold), "valid") == hold)[0]
+    if len(runs) == 0:
+        return None
+    return int(start + runs[0] * window)
+
+# the engines engine="auto" chooses from, with the step size each one is
+#   tried with. None uses the lRate given to main. NLMS steps are
+#   normalized so one value suits any signal level, RLS has no step size
+autoCandidates = {"block": None, "fdaf": None, "block-nlms": 0.5, "block-rls": None}
+
+# the highest filter order each engine is tried at by engine="auto".
+#   block RLS solves an fOrder x fOrder system per block, at order 1024 it
+#   already takes about 7 s per second of 44.1 kHz audio
+autoMaxOrders = {"block-rls": 512}
+
+# the candidates engine="auto" probes at fOrder, as (engine, lRate,
+#   engineArgs). each gets the engineArgs it accepts of the ones given
+#   (e.g. blockSize only goes to the block engines)
+def autoEngines(lRate=0.01, fOrder=100, engineArgs={}):
+    candidates = []
+    for engine, rate in autoCandidates.items():
+        if fOrder > autoMaxOrders.get(engine, fOrder):
+            continue
+        accepted = inspect.signature(engines[engine]).parameters
+        args = {k: v for k, v in engineArgs.items() if k in accepted}
+        candidates.append((engine, lRate if rate is None else rate, args))
+    return candidates
+
+# filters the first `seconds` of a job's recording with each candidate
+#   (engine, lRate, engineArgs) and measures how soon each converges to
+#   target (see convergenceSample) and how long it takes. the noise is
+#   generated in memory as noisify would, nothing is written. results are
+#   sorted best first by score: the seconds of audio before converging
+#   plus computeWeight times the seconds of compute per second of audio,
+#   so a filter that converges a little sooner but costs far more doesn't
+#   win. candidates that never converge come last, fastest first
+def probeEngines(job, candidates, fOrder=100, target=0.1, seconds=5.0, computeWeight=1.0):
+    sRate, audioData = audioIO.readWav(job["original"])
+    audioData = audioData[..., :int(seconds * sRate)]
+    seed = job["seed"] if job["seed"] is not None else noiseSeed(0, job["sentence"], job["recording"], job["amp"])
+    noisyAudio, reference = noisySignals(audioData, job["amp"], seed, sRate, job["noise"], job["noiseSource"])
+    results = []
+    for engine, lRate, engineArgs in candidates:
+        start = time.perf_counter()
+        filteredAudio = engines[engine](noisyAudio, reference, lRate, fOrder, **engineArgs)
+        elapsed = time.perf_counter() - start
+        sample = convergenceSample(audioData, noisyAudio, filteredAudio, fOrder, target)
+        results.append({"engine": engine, "lRate": lRate, "engineArgs": engineArgs,
+                        "seconds": elapsed,
+                        "samplesPerSecond": audioData.shape[-1] / elapsed,
+                        "convergenceSample": sample,
+                        "convergenceSeconds": None if sample is None else sample / sRate})
+    for r in results:
+        cost = computeWeight * r["seconds"] * sRate / audioData.shape[-1]
+        r["score"] = None if r["convergenceSeconds"] is None else r["convergenceSeconds"] + cost
+    results.sort(key=lambda r: (r["score"] is None, r["score"] or 0, r["seconds"]))
+    return results
+
+# builds the list of (recording, amplitude) jobs for every sentence folder
+#   in dataDir. each job is a dict holding the paths noisify and LMS need
+#   seed is the batch seed each job's noise seed is derived from. layout
+#   maps jobs to files (a dataLayout.DataLayout of dataDir by default)
+#   and node/nodes selects one shard of the jobs, see dataLayout.in_shard.
+#   noiseType is one of noiseTypes, babble is read from noiseSource. the
+#   jobs of a recording are consecutive, one per amplitude. sharedNoise
+#   gives every amplitude of a recording the same noise at a different
+#   level (one noise seed per recording), so all levels come from one
+#   draw, otherwise each amplitude has its own noise
+def buildJobs(dataDir="Data", amplitudes=[0.05, 0.25, 0.5], seed=0, layout=None, node=0, nodes=1,
+              noiseType="white", noiseSource=None, sharedNoise=False):
+    layout = layout or dataLayout.DataLayout(dataDir)
+    jobs = []
+    for sentence, rec, amp in layout.jobs(amplitudes, node, nodes):
+        jobs.append({
+            "sentence": sentence,
+            "recording": rec,
+            "amp": amp,
+            "original": str(layout.original(sentence, rec)),
+            "noisy": str(layout.output_base(sentence, rec, amp, "noisy")),
+            "noisyFile": str(layout.noisy(sentence, rec, amp)),
+            "filtered": str(layout.output_base(sentence, rec, amp, "filtered")),
+            "filteredFile": str(layout.filtered(sentence, rec, amp)),
+            "reference": str(layout.output_base(sentence, rec, amp, "noise_references")),
+            "referenceFile": str(layout.reference(sentence, rec, amp)),
+            "seed": None if seed is None else noiseSeed(seed, sentence, rec, 0 if sharedNoise else amp),
+            "noise": noiseType,
+            "noiseSource": noiseSource,
+            "noiseFile": str(layout.noise_settings(sentence, rec, amp)),
+        })
+    return jobs
+
+# returns the manifest key, inputs, parameters and outputs of a job, used
+#   to decide whether it has to run again. filtering without noisifying
+#   reads the noisy file an earlier run wrote, so it is an input too. the
+#   canonical rate and working dtype change the outputs, so they count
+#   as parameters
+def jobSignature(job, lRate=0.01, fOrder=100, engine="sample", engineArgs={}, stages=("noisify", "filter")):
+    key = f"{job['sentence']}/{job['recording']}@{job['amp']}"
+    params = {"amp": job["amp"], "lRate": lRate, "fOrder": fOrder,
+              "engine": engine, "engineArgs": engineArgs, "seed": job["seed"],
+              "rate": audioIO.rate, "dtype": audioIO.dtype.name}
+    inputs = [job["original"]]
+    if "noisify" not in stages:
+        inputs.append(job["noisyFile"])
+    # white noise jobs keep the signature they had before noise types
+    if job["noise"] != "white":
+        params["noise"] = job["noise"]
+        if job["noiseSource"]:
+            inputs.append(job["noiseSource"])
+    outputs = [job["noisyFile"], job["filteredFile"], job["referenceFile"]]
+    return key, inputs, params, outputs
+
+# the manifest key, inputs, parameters and outputs of noisifying a job
+#   alone, so `noisify` reruns only skip noisy files that are current.
+#   the key is apart from jobSignature's, which holds the filter settings
+def noisifySignature(job):
+    key = f"noisify:{job['sentence']}/{job['recording']}@{job['amp']}"
+    params = {"amp": job["amp"], "seed": job["seed"], "noise": job["noise"],
+              "rate": audioIO.rate, "dtype": audioIO.dtype.name}
+    inputs = [job["original"]]
+    if job["noiseSource"]:
+        inputs.append(job["noiseSource"])
+    return key, inputs, params, [job["noisyFile"], job["noiseFile"]]
+
+# the settings that decide a job's noise, saved next to its noisy file so
+#   a later filter-only run regenerates the same reference
+noiseKeys = ("seed", "noise", "noiseSource")
+
+def writeNoiseSettings(job):
+    with open(job["noiseFile"], "w") as f:
+        json.dump({k: job[k] for k in noiseKeys}, f)
+
+# the saved noise settings of a job's noisy file, None if there are none
+#   (e.g. it was written before they were saved)
+def readNoiseSettings(job):
+    if not path.isfile(job["noiseFile"]):
+        return None
+    with open(job["noiseFile"], "r") as f:
+        return json.load(f)
+
+# block size the streaming filter uses to reproduce each engine's update
+streamBlockSizes = {
+    "sample": lambda fOrder, engineArgs: 1,
+    "block": lambda fOrder, engineArgs: engineArgs.get("blockSize", 256),
+    "fdaf": lambda fOrder, engineArgs: fOrder,
+}
+
+# noisifies then filters a single job, returns (job, success, message)
+#   so that one bad recording never stops the rest of the batch. with a
+#   chunkSize the job is streamed through streamAudio in constant memory.
+#   stages picks "noisify", "filter" or both, filtering alone reads the
+#   noisy file an earlier run wrote. the job is traced as one stage and
+#   profiled when profiling is on
+def runJob(job, lRate=0.01, fOrder=100, engine="sample", engineArgs={}, chunkSize=None, stages=("noisify", "filter")):
+    with stageTrace.stage("job", profile=True, recording=job["recording"], amp=job["amp"]):
+        try:
+            dataLayout.make_parents(job["noisyFile"], job["filteredFile"], job["referenceFile"])
+            if chunkSize:
+                if engine not in streamBlockSizes:
+                    return job, False, f'engine "{engine}" cannot be streamed'
+                if job["noise"] != "white":
+                    return job, False, f'{job["noise"]} noise cannot be streamed'
+                blockSize = streamBlockSizes[engine](fOrder, engineArgs)
+                if "noisify" in stages:
+                    with stageTrace.stage("stream noisify"):
+                        stageTrace.read_file(job["original"])
+                        if not streamAudio.streamNoisify(job["original"], job["noisy"], job["amp"], chunkSize, job["seed"]):
+                            return job, False, "noisify failed"
+                        stageTrace.wrote_file(job["noisyFile"])
+                    writeNoiseSettings(job)
+                if "filter" not in stages:
+                    return job, True, "ok"
+                with stageTrace.stage("stream lms", engine=engine, fOrder=fOrder):
+                    stageTrace.read_file(job["noisyFile"])
+                    if not streamAudio.streamLMS(job["noisyFile"], job["filtered"], job["reference"], job["amp"], lRate, fOrder, blockSize, chunkSize, job["seed"]):
+                        return job, False, "LMS failed"
+                    stageTrace.wrote_file(job["filteredFile"])
+                    stageTrace.wrote_file(job["referenceFile"])
+                return job, True, "ok"
+            if "noisify" in stages:
+                if not noisify(job["original"], job["noisy"], job["amp"], job["seed"], job["noise"], job["noiseSource"]):
+                    return job, False, "noisify failed"
+                writeNoiseSettings(job)
+            if "filter" in stages and not LMS(job["noisyFile"], job["filtered"], job["reference"], job["amp"], lRate, fOrder, engine, job["seed"],
+                                              job["noise"], job["noiseSource"], **engineArgs):
+                return job, False, "LMS failed"
+        except Exception as e:
+            return job, False, f"{type(e).__name__}: {e}"
+    return job, True, "ok"
+
+# writes one output file on a background thread
+def writeOutput(outFile: str, sRate: int, data):
+    with stageTrace.stage("write", file=outFile):
+        audioIO.writeWav(outFile, sRate, data)
+        stageTrace.wrote_file(outFile)
+
+# splits jobs into runs of consecutive jobs that read the same file, e.g.
+#   the amplitudes of one recording
+def groupJobs(jobs, source="original"):
+    groups = []
+    for job in jobs:
+        if groups and groups[-1][0][source] == job[source]:
+            groups[-1].append(job)
+        else:
+            groups.append([job])
+    return groups
+
+# runs a run of jobs on one worker as a pipeline: the wav files the next
+#   jobs read are decoded on background threads while the current ones
+#   are filtered, and their outputs are written in the background, so
+#   decode, compute and encode overlap. at most `prefetch` recordings are
+#   read ahead and `pending` reads and writes are outstanding at once.
+#   noisify and LMS are done in memory, every amplitude of a recording is
+#   noisified in one pass (see noisyLevels), writing the same files as
+#   runJob without reading the noisy files back. returns (job, success,
+#   message) for each job
+def runJobs(jobs, lRate=0.01, fOrder=100, engine="sample", engineArgs={}, stages=("noisify", "filter"), prefetch=2, pending=4):
+    if "filter" in stages and engine not in engines:
+        return [(job, False, f'unknown LMS engine "{engine}"') for job in jobs]
+    # filtering alone starts from the noisy file an earlier run wrote
+    source = "original" if "noisify" in stages else "noisyFile"
+    def read(group):
+        with stageTrace.stage("decode", file=group[0][source]):
+            stageTrace.read_file(group[0][source])
+            return audioIO.readWav(group[0][source])
+    results = []
+    with backgroundIO.BackgroundIO(pending=pending) as io:
+        for group, decoded in backgroundIO.prefetch(groupJobs(jobs, source), read, io, prefetch):
+            try:
+                sRate, audioData = decoded.result()
+                nSamples, channels = audioData.shape[-1], channelsOf(audioData)
+                # noisy signals and references of every job in the group
+                if "noisify" in stages:
+                    with stageTrace.stage("noise", samples=nSamples, levels=len(group)):
+                        noisyAudio, references = noisyLevels(audioData, [job["amp"] for job in group], [job["seed"] for job in group],
+                                                             sRate, group[0]["noise"], group[0]["noiseSource"])
+                else:
+                    noisyAudio = [audioData] * len(group)
+                    with stageTrace.stage("noise", samples=nSamples):
+                        references = [jobNoise(job["seed"], nSamples, channels, sRate, job["noise"], job["noiseSource"])[..., 1:]
+                                      for job in group]
+            except Exception as e:
+                results.extend((job, [], f"{type(e).__name__}: {e}") for job in group)
+                continue
+            for job, noisy, reference in zip(group, noisyAudio, references):
+                with stageTrace.stage("job", profile=True, recording=job["recording"], amp=job["amp"]):
+                    # the group's file was read once, ahead of time, it counts for its first job
+                    if job is group[0]:
+                        stageTrace.read_file(job[source])
+                    try:
+                        dataLayout.make_parents(job["noisyFile"], job["filteredFile"], job["referenceFile"])
+                        outputs = []
+                        if "noisify" in stages:
+                            outputs.append(io.submit(writeOutput, job["noisyFile"], sRate, noisy))
+                        if "filter" in stages:
+                            with stageTrace.stage("lms", engine=engine, fOrder=fOrder, samples=nSamples, channels=channels or 1):
+                                filteredAudio = engines[engine](noisy, reference, lRate, fOrder, **engineArgs)
+                            # the reference is written at one 16-bit step per unit, as LMS does
+                            outputs.append(io.submit(writeOutput, job["referenceFile"], sRate, reference / audioIO.fullScale))
+                            outputs.append(io.submit(writeOutput, job["filteredFile"], sRate, filteredAudio))
+                        results.append((job, outputs, None))
+                    except Exception as e:
+                        results.append((job, [], f"{type(e).__name__}: {e}"))
+    # every write has finished once the io threads are closed
+    finished = []
+    for job, outputs, error in results:
+        for future in outputs:
+            if error is None and future.exception() is not None:
+                error = f"{type(future.exception()).__name__}: {future.exception()}"
+        if error is None and "noisify" in stages:
+            try:
+                writeNoiseSettings(job)
+            except OSError as e:
+                error = f"{type(e).__name__}: {e}"
+        finished.append((job, error is None, error or "ok"))
+    return finished
+
+# runs every job on a pool of worker processes and reports each result
+#   as it finishes. workers=None uses one worker per cpu core. unless the
+#   jobs are streamed, each worker gets runs of up to jobsPerTask jobs
+#   and pipelines their I/O (see runJobs). a run only ends between
+#   recordings, so all amplitudes of a recording are noisified together
+def runBatch(jobs, workers=None, lRate=0.01, fOrder=100, engine="sample", chunkSize=None, stages=("noisify", "filter"),
+             jobsPerTask=6, **engineArgs):
+    results = []
+    # jobs without a seed use the global generator, reseed each worker so
+    #   forked processes don't share a noise stream
+    with ProcessPoolExecutor(max_workers=workers, initializer=np.random.seed) as pool:
+        if chunkSize:
+            futures = [pool.submit(runJob, job, lRate, fOrder, engine, engineArgs, chunkSize, stages) for job in jobs]
+        else:
+            # shorter runs when there are few jobs, so every worker gets some
+            runLength = max(1, min(jobsPerTask, -(-len(jobs) // (workers or os.cpu_count() or 1))))
+            runs = [[]]
+            for group in groupJobs(jobs, "original" if "noisify" in stages else "noisyFile"):
+                if runs[-1] and len(runs[-1]) + len(group) > runLength:
+                    runs.append([])
+                runs[-1].extend(group)
+            futures = [pool.submit(runJobs, run, lRate, fOrder, engine, engineArgs, stages) for run in runs if run]
+        for future in as_completed(futures):
+            # streamed jobs return one result, runs a list of them
+            batch = [future.result()] if chunkSize else future.result()
+            for job, ok, message in batch:
+                print(f"{'done' if ok else 'FAILED'}: {job['recording']} at {job['amp']} ({message})")
+                results.append((job, ok, message))
+    failed = sum(1 for _, ok, _ in results if not ok)
+    print(f"{len(results) - failed} of {len(results)} jobs succeeded")
+    return results
+
+# noisifies and filters every recording in Data. the default seed makes
+#   the whole batch reproducible, seed=None gives fresh noise each run.
+#   engine="auto" probes the autoCandidates on the first recording (see
+#   autoEngines, they are given engineArgs) and uses the best ranked one
+#   (see probeEngines). with nodes > 1 only shard node of the recordings
+#   is processed, with its own manifest. stages runs just "noisify" or
+#   just "filter" (see runJob), noisifying and filtering are recorded in
+#   the manifest apart (see noisifySignature), so either stage alone
+#   skips the jobs it is current for. noiseType picks the noise added
+#   (see noiseTypes), babble is read from noiseSource, sharedNoise
+#   scales one noise to every amplitude of a recording (see buildJobs).
+#   filtering alone uses the noise settings saved with each noisy file,
+#   whatever seed and noise are given
+def main(engine="sample", lRate=0.01, fOrder=100, workers=None, force=False, chunkSize=None, seed=0, target=0.1, node=0, nodes=1,
+         stages=("noisify", "filter"), noiseType="white", noiseSource=None, sharedNoise=False, **engineArgs):
+    if noiseType not in noiseTypes:
+        print(f'ERROR: unknown noise type "{noiseType}", exiting main...')
+        return False
+    if noiseType == "babble" and not (noiseSource and path.isfile(noiseSource)):
+        print('ERROR: babble noise needs a noise source file, exiting main...')
+        return False
     # declare amplitudes to generate
     noiseAmplitudes = [0.05, 0.25, 0.5]
+    allJobs = buildJobs("Data", noiseAmplitudes, seed, node=node, nodes=nodes, noiseType=noiseType, noiseSource=noiseSource,
+                        sharedNoise=sharedNoise)
+    if "noisify" not in stages:
+        changed = 0
+        for job in allJobs:
+            settings = readNoiseSettings(job)
+            if settings is not None and any(job[k] != settings[k] for k in noiseKeys):
+                job.update(settings)
+                changed += 1
+        if changed:
+            print(f"{changed} jobs use the noise settings saved with their noisy files")
 
-    # get list of sentence files from 'Data' directory
-
-    senFolders = os.listdir("Data")
-
-    # For each Sentence Folder
-    for sentence in senFolders:
-        # define orginal data directory path
-        origin = "Data\\" + sentence + "\\_0riginal\\audio"
-        # get list of recording files
-        recordings = os.listdir(origin)
-        # for each recording file do:
-        for rec in recordings:
-            if rec.endswith(".wav"):
-                path = origin + "\\" + rec
-                for amp in noiseAmplitudes:
-                    outPath = origin.replace("_0riginal\\audio", f"_{int(amp * 100)}_percent\\noisy\\") + rec
-                    noisify(path, outPath, amp)
-                    path_noisy = outPath.replace(".wav", f"_{int(amp*100)}_noisy.wav")
-                    outPath = origin.replace("_0riginal\\audio", f"_{int(amp * 100)}_percent\\filtered\\") + rec
-                    ref = outPath.replace("filtered", "noise_references")
-                    LMS(path_noisy, outPath, ref, amp)
-    return True
+    if engine == "auto" and allJobs:
+        ranked = probeEngines(allJobs[0], autoEngines(lRate, fOrder, engineArgs), fOrder, target)
+        for r in ranked:
+            print(f"{r['engine']}: converged after {r['convergenceSeconds']} s, filtered at {r['samplesPerSecond']:.0f} samples/s")
+        engine, lRate, engineArgs = ranked[0]["engine"], ranked[0]["lRate"], ranked[0]["engineArgs"]
+        print(f"using the {engine} engine")
+
+    # build the job list from the 'Data' directory, dropping jobs whose
+    #   inputs and parameters haven't changed since the last run
+    manifestPath = path.join("Data", f".manifest_audio{dataLayout.shard_suffix(node, nodes)}.json")
+    manifest = buildManifest.load_manifest(manifestPath)
+    jobs = []
+    for job in allJobs:
+        if "filter" in stages:
+            signature = jobSignature(job, lRate, fOrder, engine, engineArgs, stages)
+        else:
+            signature = noisifySignature(job)
+        if force or not buildManifest.job_is_current(manifest, *signature):
+            jobs.append(job)
+    print(f"{len(jobs)} jobs to run")
+
+    # run the remaining jobs in parallel and record the ones that succeeded
+    with stageTrace.stage("audio batch", jobs=len(jobs)):
+        results = runBatch(jobs, workers, lRate, fOrder, engine, chunkSize, stages, **engineArgs)
+    for job, ok, _ in results:
+        if ok and "noisify" in stages:
+            buildManifest.record_job(manifest, *noisifySignature(job))
+        if ok and "filter" in stages:
+            buildManifest.record_job(manifest, *jobSignature(job, lRate, fOrder, engine, engineArgs, stages))
+    buildManifest.save_manifest(manifest, manifestPath)
+    return all(ok for _, ok, _ in results)
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
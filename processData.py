@@ -20,205 +20,396 @@
 #""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
 # import dependencies
-import parselmouth as pm
-import numpy as np
-import matplotlib.pyplot as plt
 import os.path as path
 import os
+import threading
+import audioIO
+import audioMetrics
+import backgroundIO
+import buildManifest
+import dataLayout
+import renderFigures
+import resultsStore
+import stageTrace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import OrderedDict
+from pathlib import Path
 
-# draws the spectrograms for one sound file
-def draw_spectrograms(fileName: str, orig_path: str, amplitudes=[0.05, 0.25, 0.5], dynamic_range = 70):
-    # get the original sound
-    original = pm.Sound(orig_path)
-    # set figure save location
-    figPath = orig_path.replace("_0riginal\\audio\\" + fileName, "figures\\")
+# shared LRU cache of decoded sounds so each wav is only read once per run
+#   entries are keyed by (path, modification time) so rewritten files are
+#   decoded again, and the oldest entries are dropped past the size limit.
+#   the limit holds the 10 sounds (with figures) of the recording being
+#   analyzed, the one before it and the two decoded ahead
+sound_cache = OrderedDict()
+sound_cache_size = 48
+sound_cache_stats = {"hits": 0, "misses": 0}
+# sounds are decoded ahead on a background thread (see process_data)
+sound_cache_lock = threading.Lock()
+
+# returns the Sound for file_path, decoding it only if it isn't cached.
+#   when a canonical rate is set (see audioIO) the sound is resampled to it
+def load_sound(file_path: str):
+    key = (path.abspath(file_path), os.stat(file_path).st_mtime_ns, audioIO.rate)
+    with sound_cache_lock:
+        if key in sound_cache:
+            sound_cache.move_to_end(key)
+            sound_cache_stats["hits"] += 1
+            return sound_cache[key]
+        sound_cache_stats["misses"] += 1
+    with stageTrace.stage("decode", file=file_path):
+        stageTrace.read_file(file_path)
+        snd = renderFigures.decode_sound(file_path)
+    with sound_cache_lock:
+        sound_cache[key] = snd
+        while len(sound_cache) > sound_cache_size:
+            sound_cache.popitem(last=False)
+    return snd
+
+# decodes every sound analyzing one recording needs into the cache, with
+#   figures the noise references the figures draw too
+def preload_sounds(layout, sentence: str, fileName: str, amplitudes: list, figures=False):
+    original_path = str(layout.original(sentence, fileName))
+    amp_paths, _, _ = recording_paths(fileName, original_path, amplitudes)
+    for file_path in [original_path] + [p for paths in amp_paths for p in (paths if figures else paths[:2])]:
+        load_sound(file_path)
+
+# the (sample rate, values) of every sound the figures of one recording
+#   draw, from the cache, to send to a render worker so it doesn't decode
+#   them again. the values are sent as the 16-bit samples they were read
+#   from (resampled sounds are quantized too, see audioIO.readWav), a
+#   quarter of the size of the Sound's float64 values
+def render_samples(original_path: str, amp_paths: list):
+    samples = {}
+    for file_path in [original_path] + [p for paths in amp_paths for p in paths]:
+        snd = load_sound(file_path)
+        samples[file_path] = (snd.sampling_frequency, audioIO.toInt16(snd.values))
+    return samples
+
+# returns the cache counters, e.g. to confirm each file was decoded once.
+#   they count this process only, main's render workers draw the sounds
+#   decoded here but plot's workers decode their own
+def sound_cache_info():
+    return {"hits": sound_cache_stats["hits"],
+            "misses": sound_cache_stats["misses"],
+            "size": len(sound_cache),
+            "max_size": sound_cache_size}
 
-    for i, amp in enumerate(amplitudes):
+# empties the cache and resets its counters
+def clear_sound_cache():
+    sound_cache.clear()
+    sound_cache_stats["hits"] = 0
+    sound_cache_stats["misses"] = 0
+
+# the layout of the Data tree an original recording is in, from its
+#   path Data/<sentence>/_0riginal/audio/<recording>
+def layout_of(orig_path: str):
+    return dataLayout.DataLayout(Path(orig_path).parents[3])
+
+# returns the (noisy, filtered, reference) paths for each amplitude along
+#   with the waveform and spectrogram png paths for one sound file
+def recording_paths(fileName: str, orig_path: str, amplitudes: list):
+    layout = layout_of(orig_path)
+    sentence = Path(orig_path).parents[2].name
+    amp_paths = []
+    waveform_pngs = []
+    spectrogram_pngs = []
+    for amp in amplitudes:
         # set the location of the files for amplitude amp
-        data_path = orig_path.replace("_0riginal\\audio\\" + fileName, f"_{int(amp * 100)}_percent\\")
-        noisy_path = data_path + "noisy\\" + fileName.replace(".wav", f"_{int(amp * 100)}_noisy.wav")
-        filt_path = data_path + "filtered\\" + fileName.replace(".wav", f"_{int(amp * 100)}_filtered.wav")
-        ref_path = data_path + "noise_references\\" + fileName.replace(".wav", f"_{int(amp * 100)}_noise_ref.wav")
-        # import processed audio as Sound objects
-        noisy = pm.Sound(noisy_path)
-        filtered = pm.Sound(filt_path)
-        reference = pm.Sound(ref_path)
-        # create array containing all sound objects to study
-        sounds = [original, noisy, filtered, reference]
-        # set figure size to 1930x1080
-        plt.figure(figsize=(19.2, 10.8))
-        # for each sound
-        for j, snd in enumerate(sounds):
-            # specify subplot
-            plt.subplot(2, 2, j+1)
-            # extract spectrogram object
-            spectrogram = snd.to_spectrogram()
-            # draw spectrogram
-            X, Y = spectrogram.x_grid(), spectrogram.y_grid()
-            sg_db = 10 * np.log10(spectrogram.values)
-            plt.pcolormesh(X, Y, sg_db, vmin=sg_db.max() - dynamic_range, label="spectrogram", cmap='binary', alpha=0.7)
-            plt.ylim([spectrogram.ymin, 5000])
-            # determine title
-            if i == 0:
-                plt.title("Original", fontsize=40)
-            elif i == 1:
-                plt.title("Noisy", fontsize=40)
-            elif i == 2:
-                plt.title("Filtered", fontsize=40)
-            else:
-                plt.title("Noise Reference", fontsize=40)
-            # set labels and font sizes
-            plt.xlabel("time [s]", fontsize=40)
-            plt.xticks(fontsize=20)
-            plt.ylabel("frequency [Hz]", fontsize=40)
-            plt.yticks(fontsize=20)
-        # end loop
-        # adjust layout so labels don't overlap
-        plt.tight_layout()
-        # save the waveform plots to a png file corresponding to the noise amplitude
-        plt.savefig(figPath + fileName.replace(".wav", f"_{int(amp * 100)}_spectrograms.png"))
-        # close the window to free memory space
-        plt.close()
-    return True
+        amp_paths.append((str(layout.noisy(sentence, fileName, amp)),
+                          str(layout.filtered(sentence, fileName, amp)),
+                          str(layout.reference(sentence, fileName, amp))))
+        waveform_pngs.append(str(layout.waveforms(sentence, fileName, amp)))
+        spectrogram_pngs.append(str(layout.spectrograms(sentence, fileName, amp)))
+    return amp_paths, waveform_pngs, spectrogram_pngs
+
+# draws the spectrograms for one sound file
+def draw_spectrograms(fileName: str, orig_path: str, amplitudes=[0.05, 0.25, 0.5], dynamic_range = 70):
+    amp_paths, _, spectrogram_pngs = recording_paths(fileName, orig_path, amplitudes)
+    return renderFigures.render_recording(orig_path, amp_paths, [], spectrogram_pngs, dynamic_range, sounds=load_sound)
 
 # draws the waveforms for one file, calculates the avg error, and returns
-#   these quantities as a list
-def analyze_waveforms(fileName: str, orig_path: str, amplitudes: list):
-    # initialize error% list for the file
-    analysis = [[], []]
+#   these quantities as a list. with draw=False only the errors are
+#   calculated, e.g. when the figures are rendered on a process pool
+def analyze_waveforms(fileName: str, orig_path: str, amplitudes: list, draw=True):
+    # initialize error% lists for the file, followed by the full metric
+    #   dicts for noisy and filtered from audioMetrics.compare
+    analysis = [[], [], [], []]
+    amp_paths, waveform_pngs, _ = recording_paths(fileName, orig_path, amplitudes)
+    if draw:
+        renderFigures.render_recording(orig_path, amp_paths, waveform_pngs, [], sounds=load_sound)
     # get the original sound
-    original = pm.Sound(orig_path)
-    # set figure save location
-    figPath = orig_path.replace("_0riginal\\audio\\" + fileName, "figures\\")
+    original = load_sound(orig_path)
 
     # repeat the following for each amplitude at index j
     for j, amp in enumerate(amplitudes):
-        # set the location of the files for amplitude amp
-        data_path = orig_path.replace("_0riginal\\audio\\" + fileName, f"_{int(amp * 100)}_percent\\")
-        noisy_path = data_path + "noisy\\" + fileName.replace(".wav", f"_{int(amp * 100)}_noisy.wav")
-        filt_path = data_path + "filtered\\" + fileName.replace(".wav", f"_{int(amp * 100)}_filtered.wav")
-        ref_path = data_path + "noise_references\\" + fileName.replace(".wav", f"_{int(amp * 100)}_noise_ref.wav")
-        # import processed audio as Sound objects
-        noisy = pm.Sound(noisy_path)
-        filtered = pm.Sound(filt_path)
-        reference = pm.Sound(ref_path)
-        # create array containing all sound objects to study
-        sounds = [original, noisy, filtered, reference]
-        # set figure size to 1930x1080
-        plt.figure(figsize=(19.2, 10.8))
-        # plot the waveform of each sound to one quadrant of the figure
-        for i, snd in enumerate(sounds):
-            plt.subplot(2, 2, i+1)
-            plt.plot(snd.xs(), snd.values.T)
-            plt.xlim([snd.xmin, snd.xmax])
-            if i == 0:
-                plt.title("Original", fontsize=40)
-            elif i == 1:
-                plt.title("Noisy", fontsize=40)
-            elif i == 2:
-                plt.title("Filtered", fontsize=40)
-            else:
-                plt.title("Noise Reference", fontsize=40)
-            plt.xlabel("time [s]", fontsize=20)
-            plt.xticks(fontsize=20)
-            plt.ylabel("amplitude [Hz]", fontsize=20)
-            plt.yticks(fontsize=20)
-        # end loop
-        # adjust layout so labels don't overlap
-        plt.tight_layout()
-        # save the waveform plots to a png file corresponding to the noise amplitude
-        plt.savefig(figPath + fileName.replace(".wav", f"_{int(amp * 100)}_waveforms.png"))
-        # close the window to free memory space
-        plt.close()
+        noisy_path, filt_path, ref_path = amp_paths[j]
         # calculate the average error between original vs noisy and original vs filtered
-        noisy_err = calc_avg_error(sounds[0], sounds[1])
-        filtered_err = calc_avg_error(sounds[0], sounds[2])
+        noisy_metrics = calc_metrics(original, load_sound(noisy_path))
+        filtered_metrics = calc_metrics(original, load_sound(filt_path))
         # save the errors on the row corresponding to the noise amplitude
-        analysis[0].append(noisy_err)
-        analysis[1].append(filtered_err)
+        analysis[0].append(noisy_metrics["percent_error"])
+        analysis[1].append(filtered_metrics["percent_error"])
+        analysis[2].append(noisy_metrics)
+        analysis[3].append(filtered_metrics)
     # end loop
     return analysis
 
-# calculates the average error between two sounds
-def calc_avg_error(acc: pm.Sound, exp: pm.Sound): # acc -> accepted values (original audio) exp -> experimental values (filtered/noisy)
-    err = np.zeros(acc.values.size)
-    for i in range(acc.values.size):
-        if np.isnan(acc.values[0][i]):
-            acc.values[0][i] = 0
-        if np.isnan(exp.values[0][i]):
-            exp.values[0][i] = 0
-        if acc.values[0][i] != 0:
-            err[i] = (abs(acc.values[0][i] - exp.values[0][i]) / abs(acc.values[0][i]))*100
-    return round(sum(err)/acc.values.size)
-
-# processes all audio files in a single sentence folder
-def process_data(sentence_folder: str, amp=[0.05, 0.25, 0.5]):
+# calculates the average error between two sounds, over every channel
+def calc_avg_error(acc: "parselmouth.Sound", exp: "parselmouth.Sound"): # acc -> accepted values (original audio) exp -> experimental values (filtered/noisy)
+    return audioMetrics.percent_error(acc.values, exp.values)
+
+# calculates percent error, SNR, segmental SNR and spectral distortion
+#   between two sounds (every channel) in one pass, without modifying
+#   either sound
+def calc_metrics(acc: "parselmouth.Sound", exp: "parselmouth.Sound"):
+    with stageTrace.stage("metrics", samples=acc.n_samples, channels=acc.n_channels):
+        return audioMetrics.compare(acc.values, exp.values, acc.sampling_frequency)
+
+# returns the manifest key, inputs, parameters and outputs for analyzing
+#   one recording at every amplitude, with or without its figures. the
+#   canonical rate and working dtype the sounds are decoded at are
+#   parameters too
+def recording_signature(sentence_folder: str, fileName: str, amp: list, figures=True):
+    layout = dataLayout.DataLayout(Path(sentence_folder).parent)
+    sentence = Path(sentence_folder).name
+    original_path = str(layout.original(sentence, fileName))
+    amp_paths, waveform_pngs, spectrogram_pngs = recording_paths(fileName, original_path, amp)
+    inputs = [original_path] + [p for paths in amp_paths for p in paths]
+    outputs = [str(layout.analysis(sentence, fileName))]
+    if figures:
+        outputs += waveform_pngs + spectrogram_pngs
+    key = f"{sentence}/{fileName}"
+    return key, inputs, {"amp": amp, "rate": audioIO.rate, "dtype": audioIO.dtype.name}, outputs
+
+# builds the results store rows for one recording from its errors
+def result_rows(sentence: str, fileName: str, amp: list, errors: list, audio_manifest=None):
+    rows = []
+    for i, a in enumerate(amp):
+        engine, params = buildManifest.filter_settings(audio_manifest, sentence, fileName, a)
+        rows.append(resultsStore.make_row("analysis", sentence, fileName, a, engine, params, "noisy", errors[2][i]))
+        rows.append(resultsStore.make_row("analysis", sentence, fileName, a, engine, params, "filtered", errors[3][i]))
+    return rows
+
+# processes all audio files in a single sentence folder. with a manifest,
+#   recordings whose inputs are unchanged since the last run reuse their
+#   stored errors instead of being analyzed and plotted again. with a
+#   pool the figures are rendered on it while the errors are calculated.
+#   every metric is written to the results store and the averages are
+#   queried from it. with nodes > 1 only shard node of the recordings is
+#   analyzed and the averages are left for merge to write. figures=False
+#   only analyzes, without drawing anything
+def process_data(sentence_folder: str, amp=[0.05, 0.25, 0.5], manifest=None, pool=None, store=None, audio_manifest=None, node=0, nodes=1,
+                 figures=True):
     if path.exists(sentence_folder):
+        layout = dataLayout.DataLayout(Path(sentence_folder).parent)
+        sentence = Path(sentence_folder).name
+        conn = store if store is not None else resultsStore.connect()
         # get filenames of all sounds to analyze
-        files = os.listdir(sentence_folder + "\\_0riginal\\audio")
-        # initialize errors list for noisy / filtered
-        n_errors = []
-        f_errors = []
-        # create a sublist for each amplitude
-        for a in amp:
-            n_errors.append([])
-            f_errors.append([])
-        # for each file to analyze
+        files = [f for f in layout.recordings(sentence) if dataLayout.in_shard(sentence, f, node, nodes)]
+        resultsStore.prune(conn, "analysis", sentence, files)
+        # pending figure renders and the manifest entries waiting on them
+        renders = []
+        # recordings whose inputs changed since the last run
+        pending = []
         for f in files:
-            # initialize analysis string to print to file
-            analysis = "recording\t\t|\t" \
-                       "noise amp\t\t|\t" \
-                       "avg error noisy\t\t|\t" \
-                       "avg error filtered\n"
-            # create the full relative path for audio file of name f
-            original_path = sentence_folder + "\\_0riginal\\audio\\" + f
-            # generate waveform images and return array of errors [[noisy_err],[filt_err]]
-            errors = analyze_waveforms(f,
-                                       original_path,
-                                       amp,
-                                       )
-            draw_spectrograms(f,
-                              original_path,
-                              amp)
-
-            # for each amplitude value
-            for i, a in enumerate(amp):
-                # add a line for that amplitude to analysis string
-                analysis += f"{f}\t\t|\t" \
-                            f"{amp[i]} Hz\t\t|\t" \
-                            f"{errors[0][i]} %\t\t|\t" \
-                            f"{errors[1][i]} %\n"
-                # append error values to relevant errors sublist
-                n_errors[i].append(errors[0][i])
-                f_errors[i].append(errors[1][i])
-            # write analysis string to file
-            an_file = open(sentence_folder + "\\analysis\\" + f.replace(".wav", "_analysis.txt"), "a+")
-            an_file.write(analysis)
-            an_file.close()
-        # write avg errors to another file
-        avgs = "Average Errors by Amplitude\n" \
-               "Amp\t\t|\tnoisy\t\t|\tfiltered\n"
-        for i, a in enumerate(amp):
+            signature = recording_signature(sentence_folder, f, amp, figures)
+            if manifest is not None and buildManifest.job_is_current(manifest, *signature):
+                # nothing changed, rewrite the rows from the last run in case
+                #   the store was deleted since
+                errors = buildManifest.job_results(manifest, signature[0])
+                resultsStore.replace_recording(conn, "analysis", sentence, f, result_rows(sentence, f, amp, errors, audio_manifest))
+                continue
+            pending.append((f, signature))
+        # for each file to analyze. the next recording's sounds are decoded
+        #   on a background thread while the current one is analyzed
+        ok = True
+        with backgroundIO.BackgroundIO(threads=1) as io:
+            sounds = backgroundIO.prefetch(pending, lambda p: preload_sounds(layout, sentence, p[0], amp, figures and pool is not None),
+                                           io, ahead=1)
+            for (f, signature), decoded in sounds:
+                # a recording whose files are missing or unreadable (e.g. a job
+                #   processAudio failed) is reported and the rest still analyzed
+                try:
+                    decoded.result()
+                    # initialize analysis string to print to file
+                    analysis = "recording\t\t|\t" \
+                               "noise amp\t\t|\t" \
+                               "avg error noisy\t\t|\t" \
+                               "avg error filtered\t\t|\t" \
+                               "snr noisy\t\t|\t" \
+                               "snr filtered\t\t|\t" \
+                               "seg snr noisy\t\t|\t" \
+                               "seg snr filtered\t\t|\t" \
+                               "spectral dist noisy\t\t|\t" \
+                               "spectral dist filtered\n"
+                    # create the full relative path for audio file of name f
+                    original_path = str(layout.original(sentence, f))
+                    # generate waveform images and return array of errors
+                    #   [[noisy_err],[filt_err],[noisy_metrics],[filt_metrics]]
+                    with stageTrace.stage("recording", profile=True, sentence=sentence, recording=f):
+                        errors = analyze_waveforms(f,
+                                                   original_path,
+                                                   amp,
+                                                   draw=figures and pool is None
+                                                   )
+                        if figures and pool is None:
+                            draw_spectrograms(f,
+                                              original_path,
+                                              amp)
+                        elif figures:
+                            amp_paths, waveform_pngs, spectrogram_pngs = recording_paths(f, original_path, amp)
+                            # the workers draw the sounds decoded here, so
+                            #   each file is still decoded once per run
+                            future = pool.submit(renderFigures.render_recording, original_path, amp_paths, waveform_pngs, spectrogram_pngs,
+                                                 samples=render_samples(original_path, amp_paths))
+
+                    # for each amplitude value
+                    for i, a in enumerate(amp):
+                        # add a line for that amplitude to analysis string
+                        analysis += f"{f}\t\t|\t" \
+                                    f"{amp[i]} Hz\t\t|\t" \
+                                    f"{errors[0][i]} %\t\t|\t" \
+                                    f"{errors[1][i]} %\t\t|\t" \
+                                    f"{errors[2][i]['snr']:.2f} dB\t\t|\t" \
+                                    f"{errors[3][i]['snr']:.2f} dB\t\t|\t" \
+                                    f"{errors[2][i]['seg_snr']:.2f} dB\t\t|\t" \
+                                    f"{errors[3][i]['seg_snr']:.2f} dB\t\t|\t" \
+                                    f"{errors[2][i]['spectral_distortion']:.2f} dB\t\t|\t" \
+                                    f"{errors[3][i]['spectral_distortion']:.2f} dB\n"
+                    # store every metric, then write the analysis string to file
+                    resultsStore.replace_recording(conn, "analysis", sentence, f, result_rows(sentence, f, amp, errors, audio_manifest))
+                    an_path = layout.analysis(sentence, f)
+                    with stageTrace.stage("write", file=str(an_path)):
+                        dataLayout.make_parents(an_path)
+                        an_file = open(an_path, "w")
+                        an_file.write(analysis)
+                        an_file.close()
+                        stageTrace.wrote_file(an_path)
+                    if figures and pool is not None:
+                        renders.append((future, signature, errors))
+                    elif manifest is not None:
+                        buildManifest.record_job(manifest, *signature, results=errors)
+                except Exception as e:
+                    print(f"ERROR: analyzing {sentence}/{f} failed ({type(e).__name__}: {e})")
+                    # the last run's rows would otherwise still be averaged
+                    resultsStore.replace_recording(conn, "analysis", sentence, f, [])
+                    ok = False
+        # wait for the figures, only recording the ones that rendered
+        for future, signature, errors in renders:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"ERROR: rendering figures for {signature[0]} failed ({type(e).__name__}: {e})")
+                ok = False
+                continue
+            if manifest is not None:
+                buildManifest.record_job(manifest, *signature, results=errors)
+        if nodes <= 1:
+            write_averages(conn, layout, sentence, amp)
+        if store is None:
+            conn.close()
+        return ok
+    else:
+        return False
+
+# writes the average errors of one sentence, as queried from the results
+#   store, to its averages file
+def write_averages(conn, layout, sentence: str, amp=[0.05, 0.25, 0.5]):
+    averages = {(r["amp"], r["signal"]): r for r in resultsStore.averages(conn, sentence)}
+    avgs = "Average Errors by Amplitude\n" \
+           "Amp\t\t|\tnoisy\t\t|\tfiltered\n"
+    for a in amp:
+        if (a, "noisy") in averages:
             avgs += f"{a}\t\t|\t" \
-                    f"{np.mean(n_errors[i]) * 100}%\t\t|\t" \
-                    f"{np.mean(f_errors[i]) * 100}" \
+                    f"{averages[(a, 'noisy')]['percent_error']}%\t\t|\t" \
+                    f"{averages[(a, 'filtered')]['percent_error']}%" \
                     f"\n"
-        avgs_file = open(sentence_folder + "\\analysis\\averages.txt", "a+")
-        avgs_file.write(avgs)
-        avgs_file.close()
-
+    avgs_path = layout.averages(sentence)
+    dataLayout.make_parents(avgs_path)
+    avgs_file = open(avgs_path, "w")
+    avgs_file.write(avgs)
+    avgs_file.close()
 
+# merges the manifests and results stores written by `nodes` sharded runs
+#   of processAudio.main and main into the unsharded ones, then writes the
+#   averages of every sentence from the merged store
+def merge(nodes: int, amp=[0.05, 0.25, 0.5], data_dir="Data"):
+    layout = dataLayout.DataLayout(data_dir)
+    for kind in ["audio", "data"]:
+        manifest_path = path.join(data_dir, f".manifest_{kind}.json")
+        manifest = buildManifest.load_manifest(manifest_path)
+        for node in range(nodes):
+            shard = path.join(data_dir, f".manifest_{kind}{dataLayout.shard_suffix(node, nodes)}.json")
+            buildManifest.merge_manifest(manifest, buildManifest.load_manifest(shard))
+        buildManifest.save_manifest(manifest, manifest_path)
+    store = resultsStore.connect(path.join(data_dir, "results.sqlite"))
+    for node in range(nodes):
+        shard = path.join(data_dir, f"results{dataLayout.shard_suffix(node, nodes)}.sqlite")
+        if path.isfile(shard):
+            resultsStore.merge(store, shard)
+        else:
+            print(f"ERROR: no results from node {node} ({shard})")
+    for sentence in layout.sentences():
+        resultsStore.prune(store, "analysis", sentence, layout.recordings(sentence))
+        write_averages(store, layout, sentence, amp)
+    store.close()
+    return True
 
-        return True
-    else:
-        return False
+# renders the figures of every recording in Data on a process pool,
+#   without analyzing them. nodes and node select a shard as in main
+def plot(workers=None, amp=[0.05, 0.25, 0.5], node=0, nodes=1):
+    layout = dataLayout.DataLayout("Data")
+    ok = True
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for sen in layout.sentences():
+            for f in layout.recordings(sen):
+                if dataLayout.in_shard(sen, f, node, nodes):
+                    original_path = str(layout.original(sen, f))
+                    amp_paths, waveform_pngs, spectrogram_pngs = recording_paths(f, original_path, amp)
+                    future = pool.submit(renderFigures.render_recording, original_path, amp_paths, waveform_pngs, spectrogram_pngs)
+                    futures[future] = f"{sen}/{f}"
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"ERROR: rendering figures for {futures[future]} failed ({type(e).__name__}: {e})")
+                ok = False
+    return ok
 
 ## main
-def main():
+#   with nodes > 1 only shard node of the recordings is analyzed, with its
+#   own manifest and results store, see merge. figures=False skips the
+#   figures (and the pool that renders them). returns whether every
+#   sentence was analyzed and every figure rendered
+def main(force=False, workers=None, node=0, nodes=1, figures=True):
+    suffix = dataLayout.shard_suffix(node, nodes)
+    # the manifest lets reruns skip recordings that haven't changed
+    manifest_path = path.join("Data", f".manifest_data{suffix}.json")
+    manifest = buildManifest.load_manifest(manifest_path)
+    if force:
+        manifest["jobs"] = {}
+
+    # the engine and parameters each file was filtered with
+    audio_manifest = buildManifest.load_manifest(path.join("Data", f".manifest_audio{suffix}.json"))
+    store = resultsStore.connect(path.join("Data", f"results{suffix}.sqlite"))
 
-    sentences = os.listdir("Data")
-    for sen in sentences:
-        process_data("Data\\" + sen)
+    # figures are rendered in parallel, workers=None uses every cpu core
+    pool = ProcessPoolExecutor(max_workers=workers) if figures else None
+    ok = True
+    try:
+        layout = dataLayout.DataLayout("Data")
+        for sen in layout.sentences():
+            with stageTrace.stage("sentence", sentence=sen):
+                ok = process_data(str(layout.sentence_dir(sen)), manifest=manifest, pool=pool, store=store,
+                             audio_manifest=audio_manifest, node=node, nodes=nodes, figures=figures) and ok
+            buildManifest.save_manifest(manifest, manifest_path)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    store.close()
+    print(f"sound cache: {sound_cache_info()}")
+    return ok
 
 
 if __name__ == "__main__":
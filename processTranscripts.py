@@ -0,0 +1,309 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   processTranscripts.py
+#       turns every sentence's english transcription and every original,
+#       noisy and filtered recording into Arpabet phonemes in one batch.
+#       transcripts are looked up word by word in the CMU pronouncing
+#       dictionary, which is parsed once and pickled next to the Data
+#       tree, and recordings are decoded by pocketsphinx's phone decoder
+#       on a process pool where each worker builds its decoder once and
+#       reuses it for every file. the phonemes and the time each item
+#       took are written to the transcripts table of the results store.
+#       every sequence is then scored against the sentence's reference
+#       phonemes in transcript.ipa (see phonemeMetrics) and the phoneme
+#       error rates are tabulated per amplitude and filter setting next
+#       to the waveform metrics from processData
+#
+#   Preconditions: processAudio has been run and the Data tree is
+#       formatted as described in processAudio.py, with a transcript.txt
+#       in each sentence folder. pocketsphinx is installed, it is only
+#       imported once a dictionary or decoder is needed
+#
+#   Postconditions: the results store holds the phonemes and phoneme
+#       error rate of every transcript and recording, recordings that
+#       haven't changed since the last run were not decoded again, and
+#       a csv table of the average error rates has been written
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import csv
+import os
+import os.path as path
+import pickle
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import audioIO
+import buildManifest
+import dataLayout
+import phonemeMetrics
+import resultsStore
+import stageTrace
+
+# where the parsed pronunciation dictionary is cached
+dict_cache_path = path.join("Data", ".cmudict.pickle")
+
+# the sample rate pocketsphinx's acoustic model expects
+decoder_rate = 16000
+
+# settings of the phone decoder, passed to pocketsphinx.Decoder
+decoder_config = {"allphone": path.join("en-us", "en-us-phone.lm.bin"),
+                  "beam": 1e-20,
+                  "pbeam": 1e-20,
+                  "lw": 2.0}
+
+# dictionaries and decoders already loaded by this process
+pron_dicts = {}
+decoders = {}
+
+# the pronouncing dictionary to use: the CMUDICT environment variable if
+#   it is set, otherwise the copy of cmudict that ships with pocketsphinx
+def dict_source():
+    if os.environ.get("CMUDICT"):
+        return os.environ["CMUDICT"]
+    import pocketsphinx as ps
+    return ps.get_model_path(path.join("en-us", "cmudict-en-us.dict"))
+
+# parses a cmudict file into {word: "PH ON EMES"} keeping each word's
+#   first pronunciation. both the plain format ("word(2) P1 P2") and
+#   nltk's ("WORD 2 P1 P2") are read
+def parse_dict(source: str):
+    pron_dict = {}
+    with open(source, "r", encoding="latin-1") as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens or tokens[0].startswith(";;;"):
+                continue
+            word = re.sub(r"\(\d+\)$", "", tokens[0]).lower()
+            phonemes = tokens[2:] if len(tokens) > 1 and tokens[1].isdigit() else tokens[1:]
+            pron_dict.setdefault(word, " ".join(phonemes))
+    return pron_dict
+
+# returns the dictionary at source (see dict_source), loaded at most once
+#   per process. the parsed dictionary is pickled with the size and mtime
+#   of its source, so the text is only parsed again when it changes
+def load_dict(source=None):
+    source = path.abspath(source or dict_source())
+    if source in pron_dicts:
+        return pron_dicts[source]
+    stat = os.stat(source)
+    stamp = {"source": source, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    pron_dict = None
+    if path.isfile(dict_cache_path):
+        with open(dict_cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached["stamp"] == stamp:
+            pron_dict = cached["dict"]
+    if pron_dict is None:
+        with stageTrace.stage("parse dictionary", file=source):
+            pron_dict = parse_dict(source)
+        dataLayout.make_parents(dict_cache_path)
+        tmp_path = f"{dict_cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"stamp": stamp, "dict": pron_dict}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, dict_cache_path)
+    pron_dicts[source] = pron_dict
+    return pron_dict
+
+# the words of a transcription, lowercase with punctuation removed
+def tokenize(text: str):
+    return [w.strip("'") for w in re.findall(r"[a-z']+", text.lower()) if w.strip("'")]
+
+# returns the phonemes of a transcription and the words that aren't in
+#   the dictionary, which are left out
+def text_to_phonemes(text: str, pron_dict: dict):
+    phonemes = []
+    missing = []
+    for word in tokenize(text):
+        if word in pron_dict:
+            phonemes.extend(pron_dict[word].split())
+        else:
+            missing.append(word)
+    return phonemes, missing
+
+# returns this process's phone decoder, building it on first use
+def get_decoder():
+    if "phone" not in decoders:
+        import pocketsphinx as ps
+        config = dict(decoder_config)
+        config["allphone"] = ps.get_model_path(config["allphone"])
+        decoders["phone"] = ps.Decoder(lm=None, samprate=decoder_rate, loglevel="FATAL", **config)
+    return decoders["phone"]
+
+# decodes a wav file to its phonemes, dropping silences and noises.
+#   channels are mixed down since the decoder takes mono 16 kHz audio
+def sound_to_phonemes(file_path: str):
+    with stageTrace.stage("decode", file=file_path):
+        stageTrace.read_file(file_path)
+        sRate, audioData = audioIO.readWav(file_path)
+        audioData = audioIO.resample(audioData, sRate, decoder_rate)
+        if audioData.ndim > 1:
+            audioData = audioData.mean(axis=0)
+    with stageTrace.stage("recognize", file=file_path):
+        decoder = get_decoder()
+        decoder.start_utt()
+        decoder.process_raw(audioIO.toInt16(audioData).tobytes(), full_utt=True)
+        decoder.end_utt()
+        hyp = decoder.hyp()
+    if hyp is None:
+        return []
+    return [p for p in hyp.hypstr.split() if p != "SIL" and not p.startswith("+")]
+
+# builds the decoder when a worker starts, so its first file isn't slower
+def init_worker():
+    get_decoder()
+
+# transcribes a batch of items on one worker, returns (item, phonemes,
+#   seconds, error) for each, where error is None on success
+def transcribe_batch(items: list):
+    results = []
+    for item in items:
+        start = time.perf_counter()
+        try:
+            phonemes = sound_to_phonemes(item["file"])
+            results.append((item, phonemes, time.perf_counter() - start, None))
+        except Exception as e:
+            results.append((item, [], time.perf_counter() - start, f"{type(e).__name__}: {e}"))
+    return results
+
+# every recording to transcribe as a dict of sentence, recording, amp,
+#   signal ("original", "noisy" or "filtered") and file. amplitudes whose
+#   files don't exist yet are skipped
+def build_items(layout, amplitudes: list, signals=["original", "noisy", "filtered"]):
+    items = []
+    for sentence in layout.sentences():
+        for rec in layout.recordings(sentence):
+            if "original" in signals:
+                items.append({"sentence": sentence, "recording": rec, "amp": 0.0, "signal": "original",
+                              "file": str(layout.original(sentence, rec))})
+            for amp in amplitudes:
+                for signal in ["noisy", "filtered"]:
+                    file_path = layout.noisy(sentence, rec, amp) if signal == "noisy" else layout.filtered(sentence, rec, amp)
+                    if signal in signals and file_path.is_file():
+                        items.append({"sentence": sentence, "recording": rec, "amp": amp, "signal": signal,
+                                      "file": str(file_path)})
+    return items
+
+# returns the manifest key, inputs, parameters and outputs of an item
+def item_signature(item: dict):
+    key = f"{item['sentence']}/{item['recording']}@{item['amp']}/{item['signal']}"
+    return key, [item["file"]], {"decoder": decoder_config}, []
+
+# the results store row of a transcribed item, with the engine and filter
+#   parameters processAudio used for it
+def item_row(item: dict, phonemes: list, seconds: float, audio_manifest):
+    if item["signal"] == "original":
+        engine, params = "none", {}
+    else:
+        engine, params = buildManifest.filter_settings(audio_manifest, item["sentence"], item["recording"], item["amp"])
+    return resultsStore.make_transcript_row(item["sentence"], item["recording"], item["amp"], engine, params,
+                                            item["signal"], phonemes, seconds)
+
+# converts every sentence's transcript.txt to phonemes with one load of
+#   the dictionary, returns the results store rows
+def transcribe_texts(layout):
+    pron_dict = load_dict()
+    rows = []
+    for sentence in layout.sentences():
+        transcript = layout.transcript(sentence)
+        if not transcript.is_file():
+            print(f"ERROR: {sentence} has no transcript.txt")
+            continue
+        start = time.perf_counter()
+        phonemes, missing = text_to_phonemes(transcript.read_text(), pron_dict)
+        if missing:
+            print(f"{sentence}: not in the dictionary: {' '.join(missing)}")
+        rows.append(resultsStore.make_transcript_row(sentence, transcript.name, 0.0, "none", {}, "transcript",
+                                                     phonemes, time.perf_counter() - start))
+    return rows
+
+# reads a phonemes file, one Arpabet symbol per line
+def read_phonemes(file_path):
+    with open(file_path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+# scores every stored sequence against its sentence's transcript.ipa in one
+#   batch and stores the phoneme error rates
+def evaluate(layout, conn):
+    references = {}
+    for sentence in layout.sentences():
+        if layout.transcript_phonemes(sentence).is_file():
+            references[sentence] = read_phonemes(layout.transcript_phonemes(sentence))
+        else:
+            print(f"ERROR: {sentence} has no transcript.ipa")
+    rows = [r for r in resultsStore.transcripts(conn) if r["sentence"] in references]
+    with stageTrace.stage("phoneme error rate", pairs=len(rows)):
+        rates = phonemeMetrics.error_rates([references[r["sentence"]] for r in rows], [r["phonemes"] for r in rows])
+    # transcripts() split the phonemes, the update matches rows by key only
+    resultsStore.set_error_rates(conn, [(r, None if rate != rate else float(rate)) for r, rate in zip(rows, rates)])
+    return resultsStore.phoneme_error_rates(conn)
+
+# writes the table from evaluate to a csv file and prints it
+def write_table(table: list, out_file: str):
+    columns = ["amp", "engine", "params", "signal", "n", "phoneme_error_rate"] + resultsStore.metrics
+    with open(out_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(table)
+    print("amp\tsignal\t\tengine\t\tPER\t\tavg error")
+    for row in table:
+        error = "" if row["percent_error"] is None else f"{row['percent_error']:.1f}%"
+        print(f"{row['amp']}\t{row['signal']:<12}\t{row['engine']:<12}\t{100 * (row['phoneme_error_rate'] or 0):.1f}%\t\t{error}")
+
+## main
+#   transcribes every transcript and recording in Data. recordings are
+#   sent to the workers batch_size at a time, and with a manifest only
+#   recordings that changed since the last run are decoded again
+#   afterwards every sequence is scored and the table of phoneme error
+#   rates is written to out_file
+def main(force=False, workers=None, amplitudes=[0.05, 0.25, 0.5], signals=["original", "noisy", "filtered"], batch_size=8,
+         out_file="phoneme_error_rates.csv"):
+    layout = dataLayout.DataLayout("Data")
+    manifest_path = path.join("Data", ".manifest_transcripts.json")
+    manifest = buildManifest.load_manifest(manifest_path)
+    if force:
+        manifest["jobs"] = {}
+    # the engine and parameters each file was filtered with
+    audio_manifest = buildManifest.load_manifest(path.join("Data", ".manifest_audio.json"))
+
+    with stageTrace.stage("transcripts"):
+        rows = transcribe_texts(layout)
+    items = []
+    for item in build_items(layout, amplitudes, signals):
+        signature = item_signature(item)
+        if buildManifest.job_is_current(manifest, *signature):
+            # unchanged, reuse the phonemes and time from the last run
+            result = buildManifest.job_results(manifest, signature[0])
+            rows.append(item_row(item, result["phonemes"], result["seconds"], audio_manifest))
+        else:
+            items.append(item)
+    print(f"{len(items)} recordings to transcribe")
+
+    failed = 0
+    seconds = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(transcribe_batch, items[i:i + batch_size]) for i in range(0, len(items), batch_size)]
+        for future in as_completed(futures):
+            for item, phonemes, item_seconds, error in future.result():
+                if error is not None:
+                    print(f"FAILED: {item['file']} ({error})")
+                    failed += 1
+                    continue
+                rows.append(item_row(item, phonemes, item_seconds, audio_manifest))
+                buildManifest.record_job(manifest, *item_signature(item),
+                                         results={"phonemes": phonemes, "seconds": item_seconds})
+                seconds.append(item_seconds)
+
+    store = resultsStore.connect()
+    resultsStore.write_transcripts(store, rows)
+    write_table(evaluate(layout, store), out_file)
+    store.close()
+    buildManifest.save_manifest(manifest, manifest_path)
+    print(f"{len(items) - failed} of {len(items)} recordings transcribed"
+          + (f", {sum(seconds) / len(seconds):.3f} s each on average" if seconds else ""))
+    return failed == 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   renderFigures.py
+#       draws the 2x2 waveform and spectrogram grids for processData.
+#       figures are drawn off screen with the Agg backend on a reusable
+#       template (the figure, axes, titles and labels are built once per
+#       process and only the plotted data changes), waveforms are reduced
+#       to a min/max envelope at the resolution of the axes, and
+#       recordings can be rendered in parallel on a process pool.
+#       matplotlib is only imported once the first figure is built, so
+#       processes that just decode sounds don't load it
+#
+#   Preconditions: processAudio has been run so the noisy, filtered and
+#       reference files exist for each amplitude
+#
+#   Postconditions: the _waveforms.png and _spectrograms.png files for
+#       each amplitude have been written
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import numpy as np
+import os.path as path
+import audioIO
+import dataLayout
+import featureStore
+import stageTrace
+
+# subplot titles, in the order the sounds are passed in
+titles = ["Original", "Noisy", "Filtered", "Noise Reference"]
+
+# decodes a wav file, resampled to the canonical rate if one is set. the
+#   file is read by audioIO, the same way processAudio reads it, which
+#   lets background threads decode while the GIL is free for compute.
+#   parselmouth is only imported once a sound is decoded
+def decode_sound(file_path: str):
+    sRate, data = audioIO.readWav(file_path)
+    return to_sound(sRate, data)
+
+# a Sound of samples in any format audioIO.toFloat takes, e.g. the 16-bit
+#   samples sent to a render worker
+def to_sound(sRate, data):
+    import parselmouth as pm
+    return pm.Sound(audioIO.toFloat(data).astype(np.float64), sampling_frequency=sRate)
+
+# reduces a waveform to the min and max of each pixel column, which draws
+#   the same picture as plotting every sample with far fewer points.
+#   values may be (channels x samples), the envelope then covers every
+#   channel
+def minmax_envelope(xs, values, columns: int):
+    columns = int(columns)
+    values = np.atleast_2d(values)
+    if columns <= 0 or values.shape[1] <= 2 * columns:
+        if len(values) == 1:
+            return xs, values[0]
+        # few samples, keep every one but still span every channel
+        columns = values.shape[1]
+    per_column = values.shape[1] // columns
+    used = per_column * columns
+    bins = values[:, :used].reshape(len(values), columns, per_column)
+    envelope = np.empty(2 * columns)
+    envelope[0::2] = bins.min(axis=(0, 2))
+    envelope[1::2] = bins.max(axis=(0, 2))
+    # each column's min and max share the x of the column's first sample
+    env_xs = np.repeat(xs[:used:per_column], 2)
+    return env_xs, envelope
+
+# returns the spectrogram of a wav file in dB along with its time/frequency
+#   extent. the power values come from the feature store, so the sound is
+#   only decoded and analyzed the first time
+def spectrogram_db(file_path: str, load=decode_sound):
+    values, meta = featureStore.spectrogram(file_path, load)
+    extent = [meta["x1"] - meta["dx"] / 2, meta["x1"] + (meta["nx"] - 0.5) * meta["dx"],
+              meta["y1"] - meta["dy"] / 2, meta["y1"] + (meta["ny"] - 0.5) * meta["dy"]]
+    return {"db": 10 * np.log10(values),
+            "extent": extent,
+            "ymin": meta["ymin"]}
+
+# a new off screen figure
+def new_figure():
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    return Figure(figsize=(19.2, 10.8))
+
+class FigureTemplate:
+    # builds the figure and its four axes once, kind is "waveforms" or
+    #   "spectrograms"
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.figure = new_figure()
+        self.axes = self.figure.subplots(2, 2).flatten()
+        self.artists = []
+        self.laid_out = False
+        # the subplot positions before any layout, see reset_layout
+        params = self.figure.subplotpars
+        self.initial_layout = {k: getattr(params, k) for k in ("left", "right", "bottom", "top", "wspace", "hspace")}
+        for ax, title in zip(self.axes, titles):
+            ax.set_title(title, fontsize=40)
+            ax.tick_params(labelsize=20)
+            if kind == "waveforms":
+                ax.set_xlabel("time [s]", fontsize=20)
+                ax.set_ylabel("amplitude [Hz]", fontsize=20)
+                self.artists.append(ax.plot([], [])[0])
+            else:
+                ax.set_xlabel("time [s]", fontsize=40)
+                ax.set_ylabel("frequency [Hz]", fontsize=40)
+                self.artists.append(ax.imshow(np.zeros((2, 2)), origin="lower", aspect="auto",
+                                              interpolation="nearest", cmap="binary", alpha=0.7))
+
+    # draws the four sounds as waveforms
+    def draw_waveforms(self, sounds: list):
+        for ax, line, snd in zip(self.axes, self.artists, sounds):
+            columns = ax.get_window_extent().width
+            xs, values = minmax_envelope(snd.xs(), snd.values, columns)
+            line.set_data(xs, values)
+            ax.set_xlim([snd.xmin, snd.xmax])
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+
+    # draws the four spectrograms (as returned by spectrogram_db)
+    def draw_spectrograms(self, spectrograms: list, dynamic_range=70):
+        for ax, image, sg in zip(self.axes, self.artists, spectrograms):
+            image.set_data(sg["db"])
+            image.set_extent(sg["extent"])
+            image.set_clim(sg["db"].max() - dynamic_range, sg["db"].max())
+            ax.set_xlim(sg["extent"][:2])
+            ax.set_ylim([sg["ymin"], 5000])
+
+    # puts the axes back where they were before any layout, so the next
+    #   figures are drawn and laid out the same whatever came before
+    def reset_layout(self):
+        self.figure.subplots_adjust(**self.initial_layout)
+        self.laid_out = False
+
+    # saves the current contents, laying the figure out on first use (see
+    #   render_recording)
+    def save(self, png_path: str):
+        if not self.laid_out:
+            self.figure.tight_layout()
+            self.laid_out = True
+        with stageTrace.stage("savefig", file=png_path):
+            dataLayout.make_parents(png_path)
+            self.figure.savefig(png_path)
+            stageTrace.wrote_file(png_path)
+
+# one template of each kind per process, created on first use
+templates = {}
+
+def get_template(kind: str):
+    if kind not in templates:
+        templates[kind] = FigureTemplate(kind)
+    return templates[kind]
+
+# renders every figure for one recording. amp_paths holds the (noisy,
+#   filtered, reference) paths for each amplitude and waveform_pngs /
+#   spectrogram_pngs the matching output files. sounds loads a Sound
+#   from a path, samples maps paths to (sample rate, 16-bit values)
+#   another process already decoded, otherwise each file is decoded once
+#   per call. spectrograms come from the feature store
+def render_recording(orig_path: str, amp_paths: list, waveform_pngs: list, spectrogram_pngs: list, dynamic_range=70, sounds=None,
+                     samples=None):
+    decoded = {}
+    def load(file_path):
+        if sounds is not None:
+            return sounds(file_path)
+        if samples is not None and file_path in samples and file_path not in decoded:
+            decoded[file_path] = to_sound(*samples[file_path])
+        if file_path not in decoded:
+            with stageTrace.stage("decode", file=file_path):
+                stageTrace.read_file(file_path)
+                decoded[file_path] = decode_sound(file_path)
+        return decoded[file_path]
+    # the layout depends on the tick labels, so each recording lays the
+    #   templates out again. otherwise a figure would depend on which
+    #   recording the worker happened to draw first
+    for template in templates.values():
+        template.reset_layout()
+    with stageTrace.stage("render", profile=True, file=path.basename(orig_path)):
+        original_sg = spectrogram_db(orig_path, load) if spectrogram_pngs else None
+        for i, paths in enumerate(amp_paths):
+            if waveform_pngs:
+                template = get_template("waveforms")
+                with stageTrace.stage("draw waveforms"):
+                    template.draw_waveforms([load(orig_path)] + [load(p) for p in paths])
+                template.save(waveform_pngs[i])
+            if spectrogram_pngs:
+                template = get_template("spectrograms")
+                with stageTrace.stage("draw spectrograms"):
+                    template.draw_spectrograms([original_sg] + [spectrogram_db(p, load) for p in paths], dynamic_range)
+                template.save(spectrogram_pngs[i])
+    return True
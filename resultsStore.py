@@ -0,0 +1,196 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   resultsStore.py
+#       stores every error metric row produced by processData (and by
+#       paramSweep) in one sqlite table, so results from all sentences
+#       can be aggregated with queries instead of scraping the analysis
+#       text files. each row is written once, rerunning a recording
+#       replaces its rows. rows from processData have source "analysis"
+#       and rows from paramSweep have source "sweep". the Arpabet phoneme
+#       sequences from processTranscripts go in a second table,
+#       transcripts, along with how long each one took and its phoneme
+#       error rate against the sentence's reference phonemes
+#
+#   Preconditions: none, the database and table are created on first use
+#
+#   Postconditions: the metrics table holds one row per source,
+#       sentence, recording, amplitude, engine, parameters and signal
+#       (noisy or filtered), the transcripts table one row per sentence,
+#       recording, amplitude, engine, parameters and signal (original,
+#       noisy, filtered or transcript)
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import json
+import sqlite3
+import os.path as path
+
+# default location of the results database
+db_path = path.join("Data", "results.sqlite")
+
+# the metric columns, in the same order as audioMetrics.compare
+metrics = ["percent_error", "snr", "seg_snr", "spectral_distortion"]
+
+# opens (and if needed creates) the results database
+def connect(file_path=None):
+    conn = sqlite3.connect(file_path or db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE IF NOT EXISTS metrics ("
+                  "source TEXT NOT NULL, "
+                  "sentence TEXT NOT NULL, "
+                  "recording TEXT NOT NULL, "
+                  "speaker TEXT NOT NULL, "
+                  "amp REAL NOT NULL, "
+                  "engine TEXT NOT NULL, "
+                  "params TEXT NOT NULL, "
+                  "signal TEXT NOT NULL, "
+                  "percent_error REAL, "
+                  "snr REAL, "
+                  "seg_snr REAL, "
+                  "spectral_distortion REAL, "
+                  "PRIMARY KEY (source, sentence, recording, amp, engine, params, signal))")
+    conn.execute("CREATE TABLE IF NOT EXISTS transcripts ("
+                  "sentence TEXT NOT NULL, "
+                  "recording TEXT NOT NULL, "
+                  "speaker TEXT NOT NULL, "
+                  "amp REAL NOT NULL, "
+                  "engine TEXT NOT NULL, "
+                  "params TEXT NOT NULL, "
+                  "signal TEXT NOT NULL, "
+                  "phonemes TEXT NOT NULL, "
+                  "seconds REAL, "
+                  "phoneme_error_rate REAL, "
+                  "PRIMARY KEY (sentence, recording, amp, engine, params, signal))")
+    # stores created before phoneme error rates were recorded
+    if "phoneme_error_rate" not in [c["name"] for c in conn.execute("PRAGMA table_info(transcripts)")]:
+        conn.execute("ALTER TABLE transcripts ADD COLUMN phoneme_error_rate REAL")
+    return conn
+
+# the speaker is the part of a recording's name before the first "_"
+def speaker_of(recording: str):
+    return recording.split("_")[0]
+
+# builds one row. params is a dict and is stored as sorted json so equal
+#   parameters always compare equal
+def make_row(source: str, sentence: str, recording: str, amp: float, engine: str, params: dict, signal: str, values: dict):
+    row = {"source": source,
+           "sentence": sentence,
+           "recording": recording,
+           "speaker": speaker_of(recording),
+           "amp": amp,
+           "engine": engine,
+           "params": json.dumps(params, sort_keys=True),
+           "signal": signal}
+    for metric in metrics:
+        row[metric] = values.get(metric)
+    return row
+
+# writes rows, replacing any earlier rows with the same key
+def write_rows(conn, rows: list):
+    columns = ["source", "sentence", "recording", "speaker", "amp", "engine", "params", "signal"] + metrics
+    conn.executemany(f"INSERT OR REPLACE INTO metrics ({', '.join(columns)}) "
+                     f"VALUES ({', '.join(':' + c for c in columns)})", rows)
+    conn.commit()
+
+# replaces all rows of one recording from one source with rows, so rows
+#   left over from an earlier engine or parameter set don't linger
+def replace_recording(conn, source: str, sentence: str, recording: str, rows: list):
+    conn.execute("DELETE FROM metrics WHERE source = ? AND sentence = ? AND recording = ?",
+                 [source, sentence, recording])
+    write_rows(conn, rows)
+
+# removes the rows of recordings that are no longer in a sentence folder
+def prune(conn, source: str, sentence: str, recordings: list):
+    conn.execute(f"DELETE FROM metrics WHERE source = ? AND sentence = ? "
+                 f"AND recording NOT IN ({', '.join('?' * len(recordings))})",
+                 [source, sentence] + list(recordings))
+    conn.commit()
+
+# average of every metric per amplitude and signal for one sentence, or
+#   across the whole corpus when sentence is None
+def averages(conn, sentence=None, source="analysis"):
+    where = "WHERE source = ?" + (" AND sentence = ?" if sentence is not None else "")
+    query = (f"SELECT amp, signal, COUNT(*) AS n, "
+             f"{', '.join(f'AVG({m}) AS {m}' for m in metrics)} "
+             f"FROM metrics {where} GROUP BY amp, signal ORDER BY amp, signal")
+    return [dict(r) for r in conn.execute(query, [source] + ([sentence] if sentence is not None else []))]
+
+# average of every metric per sentence, amplitude and signal
+def sentence_averages(conn, source="analysis"):
+    query = (f"SELECT sentence, amp, signal, COUNT(*) AS n, "
+             f"{', '.join(f'AVG({m}) AS {m}' for m in metrics)} "
+             f"FROM metrics WHERE source = ? GROUP BY sentence, amp, signal ORDER BY sentence, amp, signal")
+    return [dict(r) for r in conn.execute(query, [source])]
+
+# builds one transcripts row. phonemes is a list of Arpabet symbols, stored
+#   space separated, and seconds is how long transcribing it took
+def make_transcript_row(sentence: str, recording: str, amp: float, engine: str, params: dict, signal: str, phonemes: list, seconds: float):
+    return {"sentence": sentence,
+            "recording": recording,
+            "speaker": speaker_of(recording),
+            "amp": amp,
+            "engine": engine,
+            "params": json.dumps(params, sort_keys=True),
+            "signal": signal,
+            "phonemes": " ".join(phonemes),
+            "seconds": seconds}
+
+# writes transcripts rows. a file's earlier rows are replaced, including
+#   those from an earlier engine or parameter set
+def write_transcripts(conn, rows: list):
+    columns = ["sentence", "recording", "speaker", "amp", "engine", "params", "signal", "phonemes", "seconds"]
+    conn.executemany("DELETE FROM transcripts WHERE sentence = :sentence AND recording = :recording "
+                     "AND amp = :amp AND signal = :signal", rows)
+    conn.executemany(f"INSERT OR REPLACE INTO transcripts ({', '.join(columns)}) "
+                     f"VALUES ({', '.join(':' + c for c in columns)})", rows)
+    conn.commit()
+
+# the transcripts of one sentence, or of the whole corpus when sentence is
+#   None, with phonemes split back into lists
+def transcripts(conn, sentence=None):
+    where = "WHERE sentence = ?" if sentence is not None else ""
+    query = f"SELECT * FROM transcripts {where} ORDER BY sentence, recording, amp, signal"
+    rows = [dict(r) for r in conn.execute(query, [sentence] if sentence is not None else [])]
+    for row in rows:
+        row["phonemes"] = row["phonemes"].split()
+    return rows
+
+# stores phoneme error rates, rates is a list of (transcripts row, rate)
+def set_error_rates(conn, rates: list):
+    conn.executemany("UPDATE transcripts SET phoneme_error_rate = ? WHERE sentence = ? AND recording = ? "
+                     "AND amp = ? AND engine = ? AND params = ? AND signal = ?",
+                     [(rate, r["sentence"], r["recording"], r["amp"], r["engine"], r["params"], r["signal"])
+                      for r, rate in rates])
+    conn.commit()
+
+# average phoneme error rate per amplitude, engine, filter parameters
+#   and signal next to the average waveform metrics processData stored for
+#   the same files (None where there are none, e.g. for the originals).
+#   the noise seed differs for every recording, so it is left out of the
+#   parameters rows are averaged over
+def phoneme_error_rates(conn):
+    settings = "json_remove(t.params, '$.seed')"
+    query = (f"SELECT t.amp, t.engine, {settings} AS params, t.signal, COUNT(*) AS n, "
+             f"AVG(t.phoneme_error_rate) AS phoneme_error_rate, "
+             f"{', '.join(f'AVG(m.{m}) AS {m}' for m in metrics)} "
+             f"FROM transcripts t LEFT JOIN metrics m ON m.source = 'analysis' AND m.sentence = t.sentence "
+             f"AND m.recording = t.recording AND m.amp = t.amp AND m.engine = t.engine "
+             f"AND m.params = t.params AND m.signal = t.signal "
+             f"WHERE t.signal != 'transcript' "
+             f"GROUP BY t.amp, t.engine, {settings}, t.signal ORDER BY t.amp, t.engine, {settings}, t.signal")
+    return [dict(r) for r in conn.execute(query)]
+
+# copies every row of another results database (e.g. one node's shard)
+#   into conn. recordings in the other database replace their rows here,
+#   the same way replace_recording does
+def merge(conn, other_path: str):
+    columns = ", ".join(["source", "sentence", "recording", "speaker", "amp", "engine", "params", "signal"] + metrics)
+    conn.execute("ATTACH DATABASE ? AS other", [other_path])
+    try:
+        conn.execute("DELETE FROM metrics WHERE (source, sentence, recording) IN "
+                     "(SELECT source, sentence, recording FROM other.metrics)")
+        conn.execute(f"INSERT OR REPLACE INTO metrics ({columns}) SELECT {columns} FROM other.metrics")
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE other")
@@ -0,0 +1,291 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   stageTrace.py
+#       timing and profiling instrumentation for the batch pipeline.
+#       processAudio and processData wrap their stages (wav decode, LMS,
+#       spectrograms, rendering, file writes, ...) in stage() spans, and
+#       each span records its wall and cpu time, the bytes read and
+#       written inside it (also by the background I/O it started, see
+#       carry) and the peak memory of the process while it was open.
+#       spans are appended as chrome trace events, one json object per
+#       line, so every pool worker can write to the same file. a trace
+#       can be converted to a chrome://tracing / perfetto file with
+#       to_chrome or summarized per stage with summarize
+#
+#       tracing is off unless the AUDIO_TRACE environment variable (or
+#       configure) names a trace file, and AUDIO_PROFILE names a folder
+#       to write a cProfile dump of every job to. when both are off
+#       stage() returns a shared do-nothing span
+#
+#   Preconditions: none
+#
+#   Postconditions: with tracing on, one event per finished stage has
+#       been appended to the trace file, and with profiling on one .prof
+#       file per profiled job has been written
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+# import dependencies
+import cProfile
+import json
+import os
+import os.path as path
+import re
+import sys
+import threading
+import time
+
+# where events and profiles go, None turns them off. read from the
+#   environment so pool workers, forked or spawned, share the setting
+trace_path = os.environ.get("AUDIO_TRACE") or None
+profile_dir = os.environ.get("AUDIO_PROFILE") or None
+
+# spans that are currently open on each thread, innermost last. kept per
+#   thread so reads and writes done on background I/O threads are only
+#   counted by the spans open on that thread
+thread_spans = threading.local()
+
+# the open spans of the calling thread
+def open_spans():
+    if not hasattr(thread_spans, "spans"):
+        thread_spans.spans = []
+    return thread_spans.spans
+
+# spans open on any thread, they share the process's memory high-water
+#   mark (see reset_peak). the lock also guards the holds of carry
+all_spans = set()
+span_lock = threading.Lock()
+
+# the trace file of this process, reopened after a fork
+trace_file = {"pid": None, "file": None}
+write_lock = threading.Lock()
+
+# turns tracing and profiling on or off for this process and the workers
+#   it starts from now on
+def configure(trace=None, profile=None):
+    global trace_path, profile_dir
+    trace_path = trace
+    profile_dir = profile
+    for name, value in (("AUDIO_TRACE", trace), ("AUDIO_PROFILE", profile)):
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+# peak resident memory of this process in MB since the last reset_peak.
+#   linux keeps that mark in /proc/self/status, elsewhere only the peak
+#   of the whole process lifetime is known. None where neither is
+#   available (windows)
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # linux reports kilobytes, macos bytes
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+# whether the memory high-water mark can be reset, checked on first use
+peak_resettable = {"pid": None, "ok": False}
+
+# folds the high-water mark so far into every open span, then resets it
+#   to the current memory (linux only), so a span that starts now sees
+#   its own peak and not the peak of an earlier job
+def reset_peak():
+    peak = peak_rss_mb()
+    for span in all_spans:
+        span.peak_rss_mb = max(span.peak_rss_mb or 0.0, peak or 0.0)
+    if peak_resettable["pid"] != os.getpid():
+        peak_resettable.update(pid=os.getpid(), ok=path.exists("/proc/self/clear_refs"))
+    if peak_resettable["ok"]:
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            peak_resettable["ok"] = False
+
+# appends one event to the trace file
+def emit(event: dict):
+    line = json.dumps(event) + "\n"
+    with write_lock:
+        if trace_file["pid"] != os.getpid():
+            trace_file["pid"] = os.getpid()
+            trace_file["file"] = open(trace_path, "a")
+        trace_file["file"].write(line)
+        trace_file["file"].flush()
+
+# counts a file as read (or written) by every open span
+def read_file(file_path: str):
+    spans = open_spans()
+    if spans and path.isfile(file_path):
+        size = path.getsize(file_path)
+        with span_lock:
+            for span in spans:
+                span.bytes_read += size
+
+def wrote_file(file_path: str):
+    spans = open_spans()
+    if spans and path.isfile(file_path):
+        size = path.getsize(file_path)
+        with span_lock:
+            for span in spans:
+                span.bytes_written += size
+
+# wraps fn so it runs inside the spans open on the calling thread, for
+#   reads and writes handed to a background thread. the bytes it reads
+#   and writes count for those spans, which wait for it before their
+#   event is written, e.g. a job's event includes its outputs written
+#   after the job moved on
+def carry(fn):
+    spans = list(open_spans())
+    if not spans:
+        return fn
+    with span_lock:
+        for span in spans:
+            span.holds += 1
+    def run(*args):
+        previous = open_spans()
+        thread_spans.spans = spans + previous
+        try:
+            return fn(*args)
+        finally:
+            thread_spans.spans = previous
+            for span in spans:
+                span.release()
+    return run
+
+class Span:
+    # name is the stage, args are extra details shown with the event. with
+    #   profile=True and profiling on, the span is run under cProfile
+    def __init__(self, name: str, args: dict, profile=False):
+        self.name = name
+        self.args = args
+        self.profiler = cProfile.Profile() if profile and profile_dir else None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss_mb = None
+        # carried operations still running, and the event waiting on them
+        self.holds = 0
+        self.event = None
+
+    def __enter__(self):
+        open_spans().append(self)
+        with span_lock:
+            reset_peak()
+            all_spans.add(self)
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profiler is not None:
+            self.profiler.disable()
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu_start
+        open_spans().remove(self)
+        with span_lock:
+            peak = peak_rss_mb()
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, peak or 0.0) if peak is not None else None
+            all_spans.discard(self)
+        if self.profiler is not None:
+            self.dump_profile()
+        if trace_path is not None:
+            args = dict(self.args)
+            args.update(cpu_ms=cpu * 1000, peak_rss_mb=self.peak_rss_mb)
+            if exc_type is not None:
+                args["error"] = exc_type.__name__
+            with span_lock:
+                self.event = {"name": self.name, "cat": "stage", "ph": "X",
+                              "ts": self.start_time * 1e6, "dur": wall * 1e6,
+                              "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+                ready = self.holds == 0
+            if ready:
+                self.emit_event()
+        return False
+
+    # a carried operation of this span finished, the last one writes the
+    #   event if the span has already closed
+    def release(self):
+        with span_lock:
+            self.holds -= 1
+            ready = self.holds == 0 and self.event is not None
+        if ready:
+            self.emit_event()
+
+    def emit_event(self):
+        self.event["args"].update(bytes_read=self.bytes_read, bytes_written=self.bytes_written)
+        emit(self.event)
+
+    # writes the profile to profile_dir, named after the stage and its args
+    def dump_profile(self):
+        os.makedirs(profile_dir, exist_ok=True)
+        label = "_".join([self.name] + [str(v) for v in self.args.values()])
+        label = re.sub(r"[^A-Za-z0-9._-]+", "_", label)
+        self.profiler.dump_stats(path.join(profile_dir, f"{label}.{os.getpid()}.prof"))
+
+class NullSpan:
+    # stands in for Span when tracing and profiling are off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+null_span = NullSpan()
+
+# returns a span for one stage, use as `with stageTrace.stage("lms"):`.
+#   jobs pass profile=True so they are profiled when profiling is on
+def stage(name: str, profile=False, **args):
+    if trace_path is None and not (profile and profile_dir):
+        return null_span
+    return Span(name, args, profile)
+
+# reads the events of a trace file
+def load_events(file_path: str):
+    with open(file_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# converts a trace file to the chrome trace json format, which
+#   chrome://tracing and ui.perfetto.dev can open
+def to_chrome(file_path: str, out_path: str):
+    with open(out_path, "w") as f:
+        json.dump({"traceEvents": load_events(file_path), "displayTimeUnit": "ms"}, f)
+
+# totals every stage of a trace: count, wall and cpu seconds, bytes read
+#   and written, and the highest peak memory seen, slowest stage first
+def summarize(file_path: str):
+    totals = {}
+    for event in load_events(file_path):
+        total = totals.setdefault(event["name"], {"stage": event["name"], "count": 0, "seconds": 0.0, "cpu_seconds": 0.0,
+                                                  "bytes_read": 0, "bytes_written": 0, "peak_rss_mb": 0.0})
+        total["count"] += 1
+        total["seconds"] += event["dur"] / 1e6
+        total["cpu_seconds"] += event["args"]["cpu_ms"] / 1000
+        total["bytes_read"] += event["args"]["bytes_read"]
+        total["bytes_written"] += event["args"]["bytes_written"]
+        total["peak_rss_mb"] = max(total["peak_rss_mb"], event["args"]["peak_rss_mb"] or 0.0)
+    return sorted(totals.values(), key=lambda t: -t["seconds"])
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python stageTrace.py trace.jsonl [chrome_trace.json]")
+        return False
+    for t in summarize(sys.argv[1]):
+        print(f"{t['stage']:<24}{t['count']:>8}{t['seconds']:>12.3f}s{t['cpu_seconds']:>12.3f}s cpu"
+              f"{t['bytes_read'] / 1e6:>10.1f} MB in{t['bytes_written'] / 1e6:>10.1f} MB out{t['peak_rss_mb']:>10.1f} MB peak")
+    if len(sys.argv) > 2:
+        to_chrome(sys.argv[1], sys.argv[2])
+    return True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+#
+#   streamAudio.py
+#       streaming versions of processAudio.noisify and processAudio.LMS
+#       that read the wav in fixed size chunks and write the noisy,
+#       filtered and reference outputs as they go, so memory use stays
+#       constant no matter how long the recording is
+#
+#   Preconditions: the input is a 16-bit PCM wav file with any number of
+#       channels. files can't be resampled while streaming, so no
+#       canonical rate (see audioIO) may be set unless they are at it
+#
+#   Postconditions: the same files processAudio.noisify and
+#       processAudio.LMS would write have been written. streamLMS gives
+#       the same result as the block engine of processAudio.LMS with
+#       the same blockSize and reference noise
+#
+#""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+
+#import dependencies
+import numpy as np
+import wave
+import os.path as path
+import audioIO
+
+# opens inFile for chunked reading, returns None if it can't be streamed
+def openWav(inFile: str):
+    if not (path.isfile(inFile) and inFile.endswith(".wav")):
+        print('ERROR: problem reading from file or incorrect file type, exiting...')
+        return None
+    reader = wave.open(inFile, "rb")
+    if reader.getsampwidth() != 2:
+        print('ERROR: streaming only supports 16-bit wav files, exiting...')
+        reader.close()
+        return None
+    if audioIO.rate is not None and reader.getframerate() != audioIO.rate:
+        print('ERROR: streamed files cannot be resampled, exiting...')
+        reader.close()
+        return None
+    return reader
+
+# the channel count of reader as processAudio.channelsOf gives it: None
+#   for mono
+def channelsOf(reader):
+    return None if reader.getnchannels() == 1 else reader.getnchannels()
+
+# opens outFile for incremental writing with the same format as reader
+def createWav(outFile: str, sRate: int, channels=None):
+    writer = wave.open(outFile, "wb")
+    writer.setnchannels(channels or 1)
+    writer.setsampwidth(2)
+    writer.setframerate(sRate)
+    return writer
+
+# yields the samples of reader chunkSize frames at a time, as normalized
+#   floats of the working dtype (see audioIO), channels first
+def readChunks(reader, chunkSize: int):
+    channels = reader.getnchannels()
+    while True:
+        frames = reader.readframes(chunkSize)
+        if not frames:
+            return
+        chunk = np.frombuffer(frames, dtype="<i2")
+        if channels > 1:
+            chunk = np.ascontiguousarray(chunk.reshape(-1, channels).T)
+        yield audioIO.toFloat(chunk)
+
+# writes normalized samples (1-d or channels first) to writer as 16-bit
+#   frames
+def writeChunk(writer, data):
+    writer.writeframes(audioIO.toInt16(data).T.astype("<i2").tobytes())
+
+# returns a function drawing the next n noise samples (per channel), from
+#   a generator for seed or the global one when there is no seed. drawing
+#   chunk by chunk gives the same samples as processAudio.makeNoise
+#   drawing all of them at once
+def noiseSource(seed, channels=None):
+    shape = lambda n: n if channels is None else (n, channels)
+    if seed is None:
+        return lambda n: np.ascontiguousarray(np.random.normal(0, 1, shape(n)).astype(audioIO.dtype).T)
+    rng = np.random.default_rng(seed)
+    return lambda n: np.ascontiguousarray(rng.standard_normal(shape(n)).astype(audioIO.dtype).T)
+
+# streaming noisify: one pass to find the peak amplitude, a second to
+#   add the scaled noise and write the noisy file chunk by chunk. seed
+#   works as in processAudio.noisify
+def streamNoisify(inFile: str, outFile: str, amp = 0.1, chunkSize=65536, seed=None):
+    reader = openWav(inFile)
+    if reader is None:
+        return False
+    outFile = outFile.replace(".wav", f"_{int(amp*100)}_noisy.wav")
+    peak = audioIO.dtype.type(0)
+    for chunk in readChunks(reader, chunkSize):
+        peak = max(peak, np.max(np.abs(chunk)))
+    reader.rewind()
+
+    writer = createWav(outFile, reader.getframerate(), channelsOf(reader))
+    nextNoise = noiseSource(seed, channelsOf(reader))
+    for chunk in readChunks(reader, chunkSize):
+        noise = nextNoise(chunk.shape[-1]) * amp * peak
+        writeChunk(writer, chunk + noise)
+    writer.close()
+    reader.close()
+
+    if path.exists(outFile):
+        return True
+    else:
+        print('ERROR: problem writing to file, exiting noisify...')
+        return False
+
+# streaming block LMS. the filter coefficients, the last fOrder reference
+#   samples and any samples short of a full block are carried from one
+#   chunk to the next, so block boundaries fall where they would if the
+#   whole file were filtered at once. seed works as in processAudio.LMS
+def streamLMS(inFile: str, outFile: str, ref_out: str, amp = 0.1, lRate=0.01, fOrder=100, blockSize=256, chunkSize=65536, seed=None):
+    reader = openWav(inFile)
+    if reader is None:
+        return False
+    sRate = reader.getframerate()
+    # like processAudio.LMS, the first fOrder and the last 100 samples
+    #   are left unfiltered (written as 0)
+    end = reader.getnframes() - 100
+
+    channels = channelsOf(reader)
+    refWriter = createWav(ref_out.replace(".wav", f"_{int(amp * 100)}_noise_ref.wav"), sRate, channels)
+    filtWriter = createWav(outFile.replace(".wav", f"_{int(amp * 100)}_filtered.wav"), sRate, channels)
+
+    # the seeded reference is the added noise advanced by one sample, see
+    #   processAudio.jobNoise
+    nextNoise = noiseSource(seed, channels)
+    if seed is not None:
+        nextNoise(1)
+
+    # every channel is filtered at once as a (channels x samples) block,
+    #   with the same operations as processAudio.blockLMS
+    nChannels = channels or 1
+    filtCoef = np.zeros((nChannels, fOrder), dtype=audioIO.dtype)
+    # pending audio starts at sample pos, pending reference at pos - fOrder
+    pos = 0
+    audioBuf = np.zeros((nChannels, 0), dtype=audioIO.dtype)
+    refBuf = np.zeros((nChannels, fOrder), dtype=audioIO.dtype)
+    for chunk in readChunks(reader, chunkSize):
+        reference = nextNoise(chunk.shape[-1])
+        writeChunk(refWriter, reference / audioIO.fullScale)
+        audioBuf = np.concatenate((audioBuf, np.atleast_2d(chunk)), axis=1)
+        refBuf = np.concatenate((refBuf, np.atleast_2d(reference)), axis=1)
+        bufEnd = pos + audioBuf.shape[1]
+
+        # filter every full block available, the final partial block is
+        #   only filtered once the samples up to end have all been read
+        filteredAudio = np.zeros(audioBuf.shape, dtype=audioIO.dtype)
+        windows = np.lib.stride_tricks.sliding_window_view(refBuf, fOrder, axis=-1)
+        start = max(pos, fOrder)
+        while start < end and min(start + blockSize, end) <= bufEnd:
+            stop = min(start + blockSize, end)
+            noiseInput = windows[:, start - pos:stop - pos]
+            filtOutput = (noiseInput @ filtCoef[:, :, None])[:, :, 0]
+            error = audioBuf[:, start - pos:stop - pos] - filtOutput
+            filtCoef += lRate / blockSize * (error[:, None, :] @ noiseInput)[:, 0, :]
+            filteredAudio[:, start - pos:stop - pos] = error
+            start = stop
+        # everything past end stays 0, so once end is reached all is done
+        done = bufEnd if start >= end else min(start, bufEnd)
+
+        # write the finished samples and keep the rest for the next chunk
+        finished = filteredAudio[:, :done - pos]
+        writeChunk(filtWriter, finished if channels else finished[0])
+        audioBuf = audioBuf[:, done - pos:]
+        refBuf = refBuf[:, done - pos:]
+        pos = done
+
+    refWriter.close()
+    filtWriter.close()
+    reader.close()
+    return True